@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'jumpcutter')
+# once the cache grows past this many bytes, the least recently used entries are deleted.
+CACHE_MAX_BYTES = 1 << 30
+# how much of the input file is hashed from each of the start, middle and end.  Hashing all of a multi-gigabyte video
+# would take longer than the analysis we're trying to skip, and the size and mtime are in the key as well.
+_HASH_SAMPLE = 1 << 20
+
+
+class LevelCache:
+    """On-disk cache of the per-frame level arrays computed by main.scan_audio_levels (or the features of another
+    detector), so that trying different thresholds and padding on the same input doesn't decode its audio again every
+    time.
+
+    Entries are keyed by the input's path, size, modification time and a hash of part of its contents, plus
+    everything that affects the levels (the frame length and the loudness metric, or for other detectors their
+    cache_key).
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, file, frame_length, metric):
+        st = os.stat(file)
+        h = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for offset in (0, st.st_size // 2, max(0, st.st_size - _HASH_SAMPLE)):
+                f.seek(offset)
+                h.update(f.read(_HASH_SAMPLE))
+        h.update(json.dumps([os.path.abspath(file), st.st_size, st.st_mtime_ns, frame_length, metric]).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, file, frame_length, metric):
+        """Return the cached levels for file, or None.  Inputs that aren't local files (URLs) are never cached."""
+        try:
+            path = self._path(self.key(file, frame_length, metric))
+            levels = np.load(path)
+        except (OSError, ValueError):
+            return None
+        # bump the modification time, which is what eviction goes by.
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # another process evicted it since we read it, but we still have the levels
+            pass
+        return levels
+
+    def put(self, file, frame_length, metric, levels):
+        try:
+            key = self.key(file, frame_length, metric)
+        except OSError:
+            # not a file we can stat and read, e.g. a URL
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # peak-to-peak levels fit in 32 bit ints and RMS levels don't need double precision.
+        levels = levels.astype(np.float32 if levels.dtype.kind == 'f' else np.int32)
+        # write to a temporary name first so that another process never sees half a file.
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, levels)
+        os.replace(path + '.tmp', path)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:  # another process evicted it while we were listing
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # another process got there first
+                pass
+            total -= size
@@ -0,0 +1,252 @@
+"""
+Run jumpcut over many files at once.
+
+The stages of each file's jumpcut (audio analysis, audio cutting, subtitles, video chunks, final encode) are submitted
+to one shared pool of worker processes as soon as the stages they depend on are done, so the pool stays busy with a
+mix of python work and ffmpeg children from different files instead of waiting on one file at a time.
+
+A <output>.json summary with the timings and keep ratio is written next to every output.  Outputs whose summary says
+they finished are skipped, so an interrupted batch can simply be run again.
+
+Usage: python batch.py [options] INPUT... -o OUTPUT_DIR
+where each INPUT is a file, a glob, a directory (every media file in it) or a manifest (.txt with one input per line,
+optionally followed by a tab and an output path, or .json with a list of {"input": ..., "output": ...}).
+Inputs without an output path are written to OUTPUT_DIR under their path relative to the directory all of them are in,
+so a/lecture.mp4 and b/lecture.mp4 become OUTPUT_DIR/a/lecture.mp4 and OUTPUT_DIR/b/lecture.mp4.
+"""
+import concurrent.futures
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import detectors
+import main
+from intervals import Intervals
+from nonlinear_time import NonLinearTime
+
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.m4v', '.flv', '.ts', '.mpg', '.mpeg', '.wmv')
+
+
+def find_jobs(inputs, output_dir, extension=None):
+    """Expand the INPUT arguments into a list of (input file, output file).  Raises ValueError if two inputs would be
+    written to the same output."""
+    jobs = []
+    for arg in inputs:
+        if arg.endswith('.json') and os.path.isfile(arg):
+            with open(arg) as f:
+                for entry in json.load(f):
+                    jobs.append((entry['input'], entry.get('output')))
+        elif arg.endswith('.txt') and os.path.isfile(arg):
+            with open(arg) as f:
+                for line in f:
+                    if line.strip() and not line.startswith('#'):
+                        input_file, _, output_file = line.rstrip('\n').partition('\t')
+                        jobs.append((input_file, output_file or None))
+        elif os.path.isdir(arg):
+            for name in sorted(os.listdir(arg)):
+                if name.lower().endswith(MEDIA_EXTENSIONS):
+                    jobs.append((os.path.join(arg, name), None))
+        else:
+            jobs.extend((path, None) for path in sorted(glob.glob(arg)) or [arg])
+    # keep the path of each input below the directory they all share, so inputs with the same name in different
+    # directories don't end up with the same output (and summary).
+    unnamed = [os.path.dirname(os.path.abspath(input_file)) for input_file, output_file in jobs if output_file is None]
+    root = os.path.commonpath(unnamed) if unnamed else None
+    result = []
+    outputs = {}
+    for input_file, output_file in jobs:
+        if output_file is None:
+            base, ext = os.path.splitext(os.path.relpath(os.path.abspath(input_file), root))
+            output_file = os.path.join(output_dir, base + (extension or ext))
+        # the drivers of both would run at once and overwrite each other's output.
+        key = os.path.normcase(os.path.abspath(output_file))
+        if key in outputs:
+            raise ValueError('%s and %s would both be written to %s' % (outputs[key], input_file, output_file))
+        outputs[key] = input_file
+        result.append((input_file, output_file))
+    return result
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# stages, run in the worker processes.  Everything they take and return has to be picklable, so the decoded audio is
+# passed around by path and reopened in each worker.
+
+def _stage_analyse(input_file, tmpdir, threshold, padding_time, detector, use_cache):
+    audio = main.decode_audio(input_file, tmpdir)
+    keep = detector.detect(main._analyse(input_file, audio, detector, use_cache), threshold)
+    return keep.dilate(int(padding_time / main.FRAME_LENGTH))
+
+
+def _stage_cut_audio(tmpdir, keep):
+    main._jumpcut_audio(main.DecodedAudio(os.path.join(tmpdir, 'decoded.wav')), os.path.join(tmpdir, 'audio.wav'),
+                        keep)
+
+
+def _stage_subtitles(input_file, tmpdir, converter):
+    return main.prepare_subtitles(input_file, tmpdir, None, converter)
+
+
+def _stage_ffmpeg(cmd):
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _stage_select(input_file, tmpdir, outfile, keep, subtitles):
+    main.process_video_select(input_file, tmpdir, outfile, keep, 1, subtitles)
+
+
+def _stage_final(tmpdir, outfile, clips, durations, subtitles):
+    main.encode_final(tmpdir, outfile, clips, durations, subtitles)
+
+
+def _quiet_worker():
+    # the stages print the same progress messages as a single jumpcut, which would be gibberish when interleaved.
+    sys.stdout = open(os.devnull, 'w')
+
+
+class Batch:
+    def __init__(self, jobs=None, retries=1, threshold=0.7, padding_time=0.02, metric='pp', video_engine='select',
+                 use_cache=True, force=False, detector=None):
+        self.workers = jobs or os.cpu_count() or 1
+        self.retries = retries
+        self.threshold = threshold
+        self.padding_time = padding_time
+        self.metric = metric
+        self.detector = main._detector(detector, metric)
+        self.video_engine = video_engine
+        self.use_cache = use_cache
+        self.force = force
+        self.pool = None
+        self.print_lock = threading.Lock()
+
+    def log(self, message):
+        with self.print_lock:
+            print(message, flush=True)
+
+    def run(self, jobs):
+        """Process every (input, output) in jobs and return their summaries."""
+        with concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_quiet_worker) as self.pool:
+            # each file is driven by a thread that submits its stages to the pool.  Allow a few more files in flight
+            # than there are workers, so that there is always a stage ready when a worker frees up.
+            with concurrent.futures.ThreadPoolExecutor(self.workers * 2) as drivers:
+                return list(drivers.map(lambda job: self.run_job(*job), jobs))
+
+    def run_job(self, input_file, output_file):
+        summary_file = output_file + '.json'
+        if not self.force and os.path.exists(output_file) and os.path.exists(summary_file):
+            with open(summary_file) as f:
+                summary = json.load(f)
+            if summary.get('status') == 'done':
+                self.log('skipping %s (already done)' % input_file)
+                return summary
+        summary = {'input': input_file, 'output': output_file, 'status': 'failed', 'attempts': 0}
+        for attempt in range(self.retries + 1):
+            summary['attempts'] = attempt + 1
+            start = time.perf_counter()
+            try:
+                summary.update(self._run_stages(input_file, output_file))
+                summary['status'] = 'done'
+                summary.pop('error', None)
+            except Exception:
+                summary['error'] = traceback.format_exc()
+                self.log('%s failed (attempt %d of %d)' % (input_file, attempt + 1, self.retries + 1))
+            summary['total_time'] = time.perf_counter() - start
+            if summary['status'] == 'done':
+                self.log('%s done in %.1fs (kept %.1f%%)' % (input_file, summary['total_time'],
+                                                               summary['keep_ratio'] * 100))
+                break
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        with open(summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def _run_stages(self, input_file, output_file):
+        timings = {}
+        submitted = []
+
+        def submit(*args):
+            future = self.pool.submit(_timed, *args)
+            submitted.append(future)
+            return future
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            try:
+                keep, timings['analyse'] = submit(_stage_analyse, input_file, tmpdir, self.threshold,
+                                                  self.padding_time, self.detector, self.use_cache).result()
+                keep: Intervals
+                converter = NonLinearTime.from_intervals(keep, main.FRAME_LENGTH)
+                cut_audio = submit(_stage_cut_audio, tmpdir, keep)
+                retime_subtitles = submit(_stage_subtitles, input_file, tmpdir, converter)
+                chunks = []
+                if self.video_engine == 'setpts':
+                    threads = max(1, (os.cpu_count() or 1) // self.workers)
+                    pts_exprs = list(converter.generate_chunked_setpts_tree_exprs(rebase=True))
+                    clips = [os.path.join(tmpdir, 'clip%02d.mkv' % (i+1)) for i in range(len(pts_exprs))]
+                    for clip, (start, end, expr) in zip(clips, pts_exprs):
+                        chunks.append(submit(_stage_ffmpeg, main.chunk_command(input_file, clip, start, end, expr,
+                                                                               threads)))
+                _, timings['cut_audio'] = cut_audio.result()
+                subtitles, timings['subtitles'] = retime_subtitles.result()
+                if chunks:
+                    timings['video_chunks'] = sum(chunk.result()[1] for chunk in chunks)
+                    _, timings['encode'] = submit(_stage_final, tmpdir, output_file, clips,
+                                                  main.chunk_durations(converter, pts_exprs),
+                                                  subtitles).result()
+                else:
+                    _, timings['encode'] = submit(_stage_select, input_file, tmpdir, output_file, keep,
+                                                  subtitles).result()
+            finally:
+                # if a stage failed, don't pull the temporary directory out from under the ones still running.
+                for future in submitted:
+                    future.cancel()
+                concurrent.futures.wait(submitted)
+        return {'keep_ratio': keep.keep_ratio(), 'cuts': len(keep), 'chunks': len(chunks), 'timings': timings}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('inputs', nargs='+', help='input files, globs, directories or manifests')
+    parser.add_argument('--output-dir', '-o', required=True, help='where to put outputs not named by a manifest')
+    parser.add_argument('--extension', help='extension of the outputs, e.g. .mp4 (default: same as the input)')
+    parser.add_argument('--jobs', '-j', type=int, help='number of worker processes.  Default: the number of CPUs')
+    parser.add_argument('--retries', type=int, default=1, help='times to retry a file that fails.  Default: 1')
+    parser.add_argument('--threshold', type=float, default=0.7, help='see main.py.  Default: 0.7')
+    parser.add_argument('--padding', type=float, default=0.05, help='see main.py.  Default: 0.05')
+    parser.add_argument('--metric', choices=('pp', 'rms'), default='pp', help='see main.py.  Default: pp')
+    parser.add_argument('--detector', choices=sorted(detectors.DETECTORS), default='level',
+                        help='see main.py.  Default: level')
+    parser.add_argument('--min-silence', type=float, help='see main.py')
+    parser.add_argument('--hysteresis', type=float, help='see main.py')
+    parser.add_argument('--video-engine', choices=('setpts', 'select'), default='select',
+                        help='see main.py.  Default: select')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='see main.py')
+    parser.add_argument('--force', action='store_true', help='redo outputs that are already done')
+    data = parser.parse_args()
+    if shutil.which('ffmpeg') is None:
+        parser.error('ffmpeg not found')
+    detector = detectors.create(data.detector, main.FRAME_LENGTH, metric=data.metric, min_silence=data.min_silence,
+                                hysteresis=data.hysteresis)
+    batch = Batch(data.jobs, data.retries, data.threshold, data.padding, data.metric, data.video_engine,
+                  data.use_cache, data.force, detector)
+    try:
+        jobs = find_jobs(data.inputs, data.output_dir, data.extension)
+    except ValueError as e:
+        parser.error(str(e))
+    summaries = batch.run(jobs)
+    failed = [s['input'] for s in summaries if s['status'] != 'done']
+    print('%d done, %d failed' % (len(summaries) - len(failed), len(failed)))
+    for input_file in failed:
+        print('  failed: %s' % input_file)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,517 @@
+"""Rough benchmarks for the hot loops of the jumpcutter.
+
+Run with `python benchmark.py` to run everything, or pass the names of the benchmarks you are interested in.  Most
+benchmarks compare the current implementation in main.py against the per-10ms loop it replaced, on synthetic audio
+that is generated on the fly (so no ffmpeg or input files are needed).
+
+The scaling benchmark times each stage of the pipeline on 1 minute, 1 hour and 10 hours (or --sizes) of synthetic
+media, and reports its throughput and peak memory, so that a stage that stops scaling linearly shows up.
+"""
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+import detectors
+import main
+import nonlinear_time
+from intervals import Intervals
+from nonlinear_time import NonLinearTime
+
+try:
+    import audioop  # removed in Python 3.13
+except ImportError:
+    audioop = None
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def make_speech_like_wave(path, seconds, framerate=48000, nchannels=1, seed=0):
+    """Write a 16 bit wave file containing bursts of noisy tones ("speech") separated by quiet gaps ("silence")."""
+    rng = np.random.default_rng(seed)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(nchannels)
+        wf.setsampwidth(2)
+        wf.setframerate(framerate)
+        # generate a minute at a time so that long files don't need to fit in memory.
+        for start in range(0, seconds, 60):
+            length = min(60, seconds - start) * framerate
+            t = np.arange(length) / framerate
+            envelope = np.zeros(length)
+            pos = 0
+            while pos < length:
+                burst = int(rng.uniform(0.3, 3) * framerate)
+                gap = int(rng.uniform(0.1, 1.5) * framerate)
+                envelope[pos:pos + burst] = 1
+                pos += burst + gap
+            signal = envelope * np.sin(2 * np.pi * 220 * t) * 8000 + rng.normal(0, 200, length)
+            samples = np.repeat(signal.astype('<i2')[:, None], nchannels, axis=1)
+            wf.writeframesraw(samples.tobytes())
+
+
+def _timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def _legacy_wave_levels(wf):
+    # the loop find_meaningful_audio used before it was vectorised.
+    frame_size = int(main.FRAME_LENGTH * wf.getframerate())
+    width = wf.getsampwidth()
+    levels = []
+    data = wf.readframes(frame_size)
+    while data:
+        levels.append(audioop.maxpp(data, width))
+        data = wf.readframes(frame_size)
+    return levels
+
+
+@benchmark
+def levels(seconds=1800):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'audio.wav')
+        make_speech_like_wave(path, seconds)
+        nframes = int(seconds / main.FRAME_LENGTH)
+        for metric in ('pp', 'rms'):
+            with wave.open(path) as wf:
+                elapsed, _ = _timeit(main._wave_levels, wf, metric)
+            print('numpy %-3s  %12.0f frames/s' % (metric, nframes / elapsed))
+        if audioop is not None:
+            with wave.open(path) as wf:
+                elapsed, _ = _timeit(_legacy_wave_levels, wf)
+            print('audioop    %12.0f frames/s' % (nframes / elapsed))
+
+
+def make_noisy_speech_wave(path, seconds, framerate=48000, seed=0):
+    """Write a 16 bit mono wave file of voice-like harmonic tones gated by speech_intervals(seconds, seed), under the
+    kinds of noise that upset a loudness threshold: a mains hum that gets louder halfway through, hiss and a loud
+    click every couple of seconds.  Returns the speech_intervals."""
+    rng = np.random.default_rng(seed)
+    speech = speech_intervals(seconds, seed)
+    gate = np.repeat(speech.to_mask(), int(main.FRAME_LENGTH * framerate))
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(framerate)
+        # generate a minute at a time so that long files don't need to fit in memory.
+        for start in range(0, seconds, 60):
+            length = min(60, seconds - start) * framerate
+            t = start + np.arange(length) / framerate
+            # a pitch wandering around 120Hz, with its first few harmonics and syllables four times a second
+            phase = 2 * np.pi * np.cumsum(120 + 30 * np.sin(2 * np.pi * 0.7 * t)) / framerate
+            voice = sum(np.sin(k * phase) / k for k in range(1, 8)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+            hum = np.where(t < seconds / 2, 0.02, 0.05) * np.sin(2 * np.pi * 50 * t)
+            signal = 0.3 * voice * gate[start * framerate:start * framerate + length] + hum
+            signal += rng.normal(0, 0.01, length)
+            for click in rng.integers(0, length - framerate // 1000, length // (2 * framerate)):
+                signal[click:click + framerate // 1000] += rng.choice([-0.8, 0.8])
+            wf.writeframesraw((np.clip(signal, -1, 1) * 32000).astype('<i2').tobytes())
+    return speech
+
+
+@benchmark
+def detection(seconds=600):
+    """Compare the detectors on make_noisy_speech_wave: how fast they are, how many runs (and so cuts) they give and
+    how many frames they get right."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'audio.wav')
+        speech = make_noisy_speech_wave(path, seconds)
+        truth = speech.to_mask()
+        audio = main.DecodedAudio(path)
+        print('%d runs of speech' % len(speech))
+        print('detector   options             frames/s  threshold   runs  padded  correct')
+        for name, options in (('level', {}), ('level', {'min_silence': 0.2}), ('vad', {}), ('vad', {'hysteresis': 0})):
+            detector = detectors.create(name, main.FRAME_LENGTH, **options)
+            elapsed, features = _timeit(detector.features, main.mono_blocks(audio))
+            for threshold in (0.3, 0.5, 0.7):
+                keep = detector.detect(features, threshold)
+                correct = (keep.to_mask()[:len(truth)] == truth).mean()
+                print('%-10s %-18s %9.0f %10.1f %6d %7d %7.1f%%' % (
+                    name, ','.join('%s=%g' % item for item in options.items()), len(features) / elapsed, threshold,
+                    len(keep), len(keep.dilate(int(0.05 / main.FRAME_LENGTH))), correct * 100))
+
+
+def _legacy_add_padding(l, padding):
+    # the loop jumpcut padded the keep mask with before it was Intervals (see Intervals.dilate): one bool per 10ms.
+    state = l[0]
+    i = 1
+    while i < len(l):
+        if l[i] != state:
+            if not state:  # rising edge, add padding before
+                for j in range(max(0, i - padding), i): l[j] = True
+            else:  # falling edge, add padding after
+                for j in range(i, min(i + padding, len(l))): l[j] = True
+                i += padding
+                if i >= len(l): break
+            state = l[i]
+        i += 1
+
+
+def _legacy_find_runs(l):
+    # how the runs of the keep mask were found before it was Intervals (see Intervals.runs).
+    output = []
+    current_state = l[0]
+    run = 1
+    for element in l[1:]:
+        if element != current_state:
+            output.append((current_state, run))
+            current_state = element
+            run = 1
+        else:
+            run += 1
+    output.append((current_state, run))
+    return output
+
+
+def _legacy_jumpcut_audio(path, fout, should_keep):
+    # the loop _jumpcut_audio used before it worked on whole runs: 10ms in, one bool, 10ms out.
+    with wave.open(path) as fin, wave.open(fout, 'w') as fout:
+        fout.setnchannels(fin.getnchannels())
+        fout.setsampwidth(fin.getsampwidth())
+        fout.setframerate(fin.getframerate())
+        frame_size = int(main.FRAME_LENGTH * fin.getframerate())
+        should_keep = iter(should_keep)
+        data = fin.readframes(frame_size)
+        while data:
+            if next(should_keep, True):
+                fout.writeframesraw(data)
+            data = fin.readframes(frame_size)
+
+
+@benchmark
+def cut(seconds=1800):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'audio.wav')
+        out = os.path.join(tmpdir, 'out.wav')
+        make_speech_like_wave(path, seconds, nchannels=2)
+        audio = main.DecodedAudio(path)
+        keep = main.find_meaningful_audio(audio, 0.5).dilate(2)
+        size = os.path.getsize(path) / 1e6
+        elapsed, _ = _timeit(main._jumpcut_audio, audio, out, keep)
+        print('runs      %8.0f MB/s  %8.0fx realtime' % (size / elapsed, seconds / elapsed))
+        elapsed, _ = _timeit(_legacy_jumpcut_audio, path, out, keep.to_mask())
+        print('per-10ms  %8.0f MB/s  %8.0fx realtime' % (size / elapsed, seconds / elapsed))
+
+
+@benchmark
+def setpts_exprs(seconds=3600):
+    rng = np.random.default_rng(0)
+    keep = Intervals.from_mask(rng.random(int(seconds / main.FRAME_LENGTH)) > 0.3).dilate(2)
+    converter = NonLinearTime.from_intervals(keep, main.FRAME_LENGTH)
+    for name in ('generate_chunked_setpts_exprs', 'generate_chunked_setpts_tree_exprs'):
+        elapsed, chunks = _timeit(lambda: list(getattr(converter, name)()))
+        depth = max(nonlinear_time._depth(expr) for _, _, expr in chunks)
+        print('%-36s %5d chunks, max depth %3d, %.2fs' % (name, len(chunks), depth, elapsed))
+
+
+@benchmark
+def timestretch_audio(seconds=600, framerate=48000):
+    import timestretch
+    rng = np.random.default_rng(0)
+    # a timeline of 0.2-3 second segments at assorted speeds, each one a tone of its own frequency
+    bounds = np.concatenate(([0], np.cumsum(rng.uniform(0.2, 3, int(seconds / 0.2)))))
+    bounds = bounds[bounds < seconds]
+    speeds = rng.choice([0, 0.25, 0.5, 1, 1.5, 2], len(bounds))
+    freqs = rng.uniform(200, 2000, len(bounds))
+    converter = NonLinearTime(list(zip(bounds.tolist(), speeds.tolist())))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'audio.wav')
+        out = os.path.join(tmpdir, 'out.wav')
+        with wave.open(path, 'wb') as wf:
+            wf.setnchannels(2)
+            wf.setsampwidth(2)
+            wf.setframerate(framerate)
+            for i, start in enumerate(bounds):
+                end = bounds[i + 1] if i + 1 < len(bounds) else seconds
+                t = np.arange(round(start * framerate), round(end * framerate)) / framerate
+                tone = (np.sin(2 * np.pi * freqs[i] * t) * 8000).astype('<i2')
+                wf.writeframesraw(np.repeat(tone[:, None], 2, axis=1).tobytes())
+        audio = main.DecodedAudio(path)
+        elapsed, _ = _timeit(timestretch.stretch_audio, audio, out, converter)
+        print('%.0fx realtime' % (seconds / elapsed))
+
+
+def speech_intervals(seconds, seed=0):
+    """A random but repeatable schedule of "speech" (0.3-3 second bursts) and "silence" (0.1-1.5 second gaps) covering
+    seconds of media, as Intervals of FRAME_LENGTH frames."""
+    rng = np.random.default_rng(seed)
+    length = int(seconds / main.FRAME_LENGTH)
+    # draw more bursts and gaps than could possibly be needed, then cut the schedule off at the end of the media.
+    count = int(seconds / 0.4) + 1
+    bursts = (rng.uniform(0.3, 3, count) / main.FRAME_LENGTH).astype(np.int64)
+    gaps = (rng.uniform(0.1, 1.5, count) / main.FRAME_LENGTH).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(bursts + gaps)[:-1]))
+    bounds = np.minimum(np.stack([starts, starts + bursts], axis=1), length)
+    return Intervals(bounds[bounds[:, 0] < length], length)
+
+
+def make_lavfi_media(path, seconds, framerate=48000, video_size=None, video_rate=30, seed=0):
+    """Write media generated by ffmpeg's lavfi sources: a sine tone gated by speech_intervals(seconds, seed) over a
+    quiet pink noise floor (anoisesrc), and with video_size, a testsrc test pattern (needs ffmpeg)."""
+    gate = speech_intervals(seconds, seed).select_expr(main.FRAME_LENGTH)
+    filters = ["sine=frequency=220:sample_rate={0}:duration={1},volume='0.02+0.98*({2})':eval=frame[s]",
+               "anoisesrc=color=pink:amplitude=0.02:sample_rate={0}:duration={1}:seed={3}[n]",
+               "[s][n]amix=inputs=2:duration=shortest[a]"]
+    if video_size:
+        filters.append('testsrc=size={4}:rate={5}:duration={1}[v]')
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        # the gate is far too long for the command line
+        f.write(';'.join(filters).format(framerate, seconds, gate, seed, video_size, video_rate))
+    try:
+        subprocess.check_call(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                               '-filter_complex_script', f.name, '-map', '[a]']
+                              + (['-map', '[v]'] if video_size else ['-ac', '1', '-c:a', 'pcm_s16le', '-rf64', 'auto'])
+                              + [path])
+    finally:
+        os.remove(f.name)
+
+
+def make_test_video(path, seconds, size='640x360', rate=30):
+    """Write a test pattern video with speech-like audio (needs ffmpeg)."""
+    make_lavfi_media(path, seconds, video_size=size, video_rate=rate)
+
+
+def make_ass_file(path, seconds, events_per_second=1, seed=0):
+    """Write an Advanced SubStation subtitle file with about events_per_second events (of 0.5-4 seconds, some with
+    karaoke tags, overlapping each other) for every second of seconds."""
+    rng = np.random.default_rng(seed)
+    count = int(seconds * events_per_second)
+    starts = np.sort(rng.uniform(0, seconds, count))
+    ends = np.minimum(starts + rng.uniform(0.5, 4, count), seconds)
+    with open(path, 'w') as f:
+        f.write('[Script Info]\nScriptType: v4.00+\nPlayResX: 640\nPlayResY: 360\n\n'
+                '[V4+ Styles]\n'
+                'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, '
+                'Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, '
+                'Alignment, MarginL, MarginR, MarginV, Encoding\n'
+                'Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,'
+                '10,10,10,1\n\n'
+                '[Events]\n'
+                'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n')
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            text = r'{\k25}line {\k25}number {\k50}%d' % i if i % 3 == 0 else 'line number %d, with a comma' % i
+            f.write('Dialogue: 0,%s,%s,Default,,0,0,0,,%s\n' % (main._to_ass_time(start), main._to_ass_time(end),
+                                                                text))
+    return count
+
+
+@benchmark
+def video_engines(seconds=600):
+    if shutil.which('ffmpeg') is None:
+        print('skipped (needs ffmpeg)')
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'input.mkv')
+        make_test_video(path, seconds)
+        for engine in ('select', 'setpts'):
+            out = os.path.join(tmpdir, 'output-%s.mkv' % engine)
+            elapsed, _ = _timeit(main.jumpcut, path, out, 0.5, 0.02, 1, 0, None, 'pp', True, None, engine)
+            print('%-8s %8.2fs  %6.1fx realtime' % (engine, elapsed, seconds / elapsed))
+
+
+# the stages timed by the scaling benchmark, as name: (setup function, unit).  Each setup function takes the directory
+# made by make_scaling_media and returns a function to time and the number of units it will process, so that loading
+# its inputs isn't counted.
+SCALING_STAGES = {}
+
+
+def scaling_stage(name, unit):
+    def register(func):
+        SCALING_STAGES[name] = (func, unit)
+        return func
+    return register
+
+
+def _media_keep(media):
+    return main.threshold_levels(np.load(os.path.join(media, 'levels.npy')), 0.5)
+
+
+def _media_converter(media):
+    return NonLinearTime.from_intervals(_media_keep(media).dilate(2), main.FRAME_LENGTH)
+
+
+@scaling_stage('find_meaningful_audio', 'frames')
+def _scale_find_meaningful_audio(media):
+    audio = main.DecodedAudio(os.path.join(media, 'audio.wav'))
+    return (lambda: main.find_meaningful_audio(audio, 0.5)), -(-len(audio.samples) // audio.frame_size)
+
+
+@scaling_stage('VoiceDetector', 'frames')
+def _scale_voice_detector(media):
+    audio = main.DecodedAudio(os.path.join(media, 'audio.wav'))
+    detector = detectors.VoiceDetector(main.FRAME_LENGTH)
+    return (lambda: detector.detect(detector.features(main.mono_blocks(audio)), 0.5)), \
+        -(-len(audio.samples) // audio.frame_size)
+
+
+@scaling_stage('add_padding', 'frames')
+def _scale_add_padding(media):
+    mask = _media_keep(media).to_mask().tolist()
+    return (lambda: _legacy_add_padding(mask, 2)), len(mask)
+
+
+@scaling_stage('Intervals.dilate', 'frames')
+def _scale_dilate(media):
+    keep = _media_keep(media)
+    return (lambda: keep.dilate(2)), keep.length
+
+
+@scaling_stage('find_runs', 'frames')
+def _scale_find_runs(media):
+    mask = _media_keep(media).to_mask().tolist()
+    return (lambda: _legacy_find_runs(mask)), len(mask)
+
+
+@scaling_stage('_jumpcut_audio', 'frames')
+def _scale_jumpcut_audio(media):
+    audio = main.DecodedAudio(os.path.join(media, 'audio.wav'))
+    keep = _media_keep(media).dilate(2)
+    return (lambda: main._jumpcut_audio(audio, os.path.join(media, 'cut.wav'), keep)), keep.length
+
+
+@scaling_stage('NonLinearTime.convert', 'timestamps')
+def _scale_convert(media):
+    converter = _media_converter(media)
+    # ten timestamps a second, e.g. for remapping keyframes
+    times = (np.arange(int(converter.times[-1] * 10)) / 10).tolist()
+    return (lambda: [converter.convert(t) for t in times]), len(times)
+
+
+@scaling_stage('NonLinearTime.convert_many', 'timestamps')
+def _scale_convert_many(media):
+    converter = _media_converter(media)
+    times = np.arange(int(converter.times[-1] * 10)) / 10
+    return (lambda: converter.convert_many(times)), len(times)
+
+
+@scaling_stage('NonLinearTime.invert_many', 'timestamps')
+def _scale_invert_many(media):
+    converter = _media_converter(media)
+    times = np.arange(int(converter.output_times[-1] * 10)) / 10
+    return (lambda: converter.invert_many(times)), len(times)
+
+
+@scaling_stage('generate_chunked_setpts_exprs', 'segments')
+def _scale_setpts_exprs(media):
+    converter = _media_converter(media)
+    return (lambda: list(converter.generate_chunked_setpts_exprs())), len(converter.cache)
+
+
+@scaling_stage('generate_chunked_setpts_tree_exprs', 'segments')
+def _scale_setpts_tree_exprs(media):
+    converter = _media_converter(media)
+    return (lambda: list(converter.generate_chunked_setpts_tree_exprs())), len(converter.cache)
+
+
+@scaling_stage('process_subtitles', 'events')
+def _scale_process_subtitles(media):
+    converter = _media_converter(media)
+    with open(os.path.join(media, 'subtitles.ass')) as f:
+        events = sum(line.startswith('Dialogue:') for line in f)
+
+    def run():
+        with open(os.path.join(media, 'subtitles.ass')) as fin, open(os.path.join(media, 'converted.ass'), 'w') as fout:
+            main.process_subtitles(fin, fout, converter)
+    return run, events
+
+
+def make_scaling_media(directory, seconds, framerate=48000):
+    """Make the inputs of the scaling stages: a mono audio.wav (from make_lavfi_media if ffmpeg is available,
+    make_speech_like_wave otherwise), its levels.npy and a subtitles.ass.  Returns the name of the audio generator."""
+    path = os.path.join(directory, 'audio.wav')
+    if shutil.which('ffmpeg'):
+        make_lavfi_media(path, seconds, framerate)
+        generator = 'lavfi'
+    else:
+        make_speech_like_wave(path, seconds, framerate)
+        generator = 'numpy'
+    np.save(os.path.join(directory, 'levels.npy'), main.DecodedAudio(path).levels())
+    make_ass_file(os.path.join(directory, 'subtitles.ass'), seconds)
+    return generator
+
+
+def run_scaling_stage(name, media):
+    """Time one stage on the media in a directory from make_scaling_media.  This is run in a process of its own, so
+    that the peak RSS is the stage's alone."""
+    setup, unit = SCALING_STAGES[name]
+    func, count = setup(media)
+    elapsed, _ = _timeit(func)
+    return {'elapsed': elapsed, 'count': count, 'unit': unit, 'peak_rss': _peak_rss()}
+
+
+def _peak_rss():
+    """The most memory this process has had resident, in bytes.  This includes the pages of memory-mapped files that
+    were read, such as a DecodedAudio's samples, though the OS can drop those whenever it needs the memory."""
+    # linux carries ru_maxrss over from the parent through fork and exec, so it would report the benchmark's own peak
+    # (with all the media it generated) rather than the stage's.  VmHWM starts again at exec.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def parse_size(size):
+    """'90' or '90s' -> 90, '1m' -> 60, '10h' -> 36000"""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+@benchmark
+def scaling(sizes=('1m', '1h', '10h'), stages=None, framerate=48000):
+    for size in sizes:
+        seconds = parse_size(size)
+        with tempfile.TemporaryDirectory() as media:
+            elapsed, generator = _timeit(make_scaling_media, media, seconds, framerate)
+            print('-- %s (%d seconds of %s audio at %d Hz, made in %.1fs) --' % (size, seconds, generator, framerate,
+                                                                                 elapsed))
+            for name in stages or SCALING_STAGES:
+                output = subprocess.run([sys.executable, '-W', 'ignore::DeprecationWarning', os.path.abspath(__file__),
+                                         '--scaling-stage', name, media],
+                                        check=True, stdout=subprocess.PIPE, text=True).stdout
+                result = json.loads(output)
+                rate = result['count'] / result['elapsed'] if result['elapsed'] else float('inf')
+                print('%-36s %9.3fs %10.0fx realtime %14.0f %s/s %9.1f MB peak RSS' % (
+                    name, result['elapsed'], seconds / result['elapsed'] if result['elapsed'] else float('inf'),
+                    rate, result['unit'], result['peak_rss'] / 1e6))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run (default: all of %s)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--sizes', default='1m,1h,10h',
+                        help='comma separated lengths of media for the scaling benchmark.  Default: 1m,1h,10h')
+    parser.add_argument('--stages', help='comma separated stages for the scaling benchmark (default: all of %s)'
+                                         % ', '.join(SCALING_STAGES))
+    parser.add_argument('--framerate', type=int, default=48000,
+                        help='sample rate of the scaling benchmark\'s audio.  Default: 48000')
+    # used by the scaling benchmark to run each stage in a process of its own
+    parser.add_argument('--scaling-stage', nargs=2, metavar=('STAGE', 'MEDIA'), help=argparse.SUPPRESS)
+    data = parser.parse_args()
+    if data.scaling_stage:
+        print(json.dumps(run_scaling_stage(*data.scaling_stage)))
+        raise SystemExit
+    options = {'scaling': {'sizes': data.sizes.split(','), 'framerate': data.framerate,
+                           'stages': data.stages and data.stages.split(',')}}
+    for name in data.benchmarks or BENCHMARKS:
+        print('== %s ==' % name)
+        BENCHMARKS[name](**options.get(name, {}))
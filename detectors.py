@@ -0,0 +1,265 @@
+"""
+Deciding which frames of the audio are meaningful.
+
+A detector works in two steps: features() turns the audio into a row of numbers for every frame, and detect() decides
+from those and the threshold which frames to keep.  The features are what the analysis cache stores (under the
+detector's cache_key), so trying another threshold only repeats the second step.
+
+The detectors, by the name they are chosen with (see create):
+
+level   the loudness of each frame ('pp' or 'rms', see frame_levels), keeping every frame louder than the threshold'th
+        quietest one.  This is the original detector.
+vad     a voice activity detector.  It scores each frame by how far its energy is above the noise floor around it, how
+        much its spectrum is changing (spectral flux) and how noise-like it is (zero-crossing rate), smooths the score
+        so that a click or two can't start a run, and keeps a run going from where the score rises above one threshold
+        until it falls below a lower one (hysteresis).  A steady hum or hiss raises the noise floor rather than the
+        score, so the result is far fewer, longer runs than level gives, and so fewer cuts and chunks to encode.
+
+Both of them then merge runs separated by less than min_silence seconds.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from intervals import Intervals
+
+# defaults for VoiceDetector: the silences it merges away, in seconds, and how far below the on threshold the off
+# threshold is, as a fraction of the frames.
+MIN_SILENCE = 0.2
+HYSTERESIS = 0.1
+# the noise floor is the NOISE_PERCENTILE quietest frame of each second, or of any second within NOISE_WINDOW seconds
+# of it if one of those is quieter.
+NOISE_PERCENTILE = 0.1
+NOISE_WINDOW = 15
+# decibels above the noise floor that count as much as one unit of flux or noise
+SNR_SCALE = 10.0
+# frames crossing zero more often than this (as a fraction of their samples) are hiss rather than voice
+NOISY_ZCR = 0.25
+# how many frequency bands the spectrum is split into for the flux, the seconds it is averaged over and its weight
+FLUX_BANDS = 16
+FLUX_WINDOW = 0.1
+FLUX_SCALE = 3.0
+# seconds the score is median filtered over
+SMOOTHING = 0.05
+
+
+def frame_levels(samples, frame_size, metric='pp'):
+    """Compute the level of each frame_size-sample frame in a 1D array of mono samples.  If the length of samples is
+    not a multiple of frame_size, the leftover samples at the end are counted as one extra, shorter frame.
+    """
+    if samples.dtype == np.uint8:
+        # 8 bit wave files are unsigned.
+        samples = samples.astype(np.int16) - 128
+    whole = len(samples) // frame_size * frame_size
+    frames = samples[:whole].reshape(-1, frame_size)
+    if whole < len(samples):
+        tail = samples[whole:].reshape(1, -1)
+        return np.concatenate([_frame_levels_2d(frames, metric), _frame_levels_2d(tail, metric)])
+    return _frame_levels_2d(frames, metric)
+
+
+def _frame_levels_2d(frames, metric):
+    if metric == 'pp':
+        # widen before subtracting so that the distance between two 16 bit samples can't overflow.
+        return frames.max(axis=1).astype(np.int64) - frames.min(axis=1)
+    elif metric == 'rms':
+        frames = frames.astype(np.float64)
+        return np.sqrt(np.einsum('ij,ij->i', frames, frames) / frames.shape[1])
+    raise ValueError('unknown loudness metric %r' % metric)
+
+
+def threshold_levels(levels, threshold):
+    # threshold is the percentage of audio frames that should be false, so 0.3 will mark approximately 70% of the audio
+    # as meaningful
+    # to implement this, we pick the [threshold]th smallest level as our minimum level.  np.partition only has to put
+    # that one element in its sorted position rather than sorting the whole array.
+    return Intervals.from_levels(levels, _percentile(levels, threshold))
+
+
+def _percentile(values, fraction):
+    k = min(int(len(values) * fraction), len(values) - 1)
+    return np.partition(values, k)[k]
+
+
+class Detector:
+    """Base class of the detectors.  Subclasses set name, list the keyword arguments create may pass them in OPTIONS
+    and implement features and keep.
+
+    frame_length is the length of a frame in seconds, and min_silence the length in seconds of the shortest silence
+    that is kept: runs with less than that between them are merged into one.
+    """
+    name = None
+    OPTIONS = ('min_silence',)
+
+    def __init__(self, frame_length, min_silence=0.0):
+        self.frame_length = frame_length
+        self.min_silence = min_silence
+
+    @property
+    def cache_key(self):
+        """What the features are cached under, which must change whenever they would."""
+        return self.name
+
+    def features(self, blocks):
+        """Compute the features of every frame.  blocks yields (frame_size, samples) for consecutive blocks of mono
+        samples, each a whole number of frame_size-sample frames long apart from the last.  Returns an array with one
+        element or row per frame."""
+        raise NotImplementedError
+
+    def keep(self, features, threshold):
+        """Return the Intervals of the frames to keep, before min_silence is applied."""
+        raise NotImplementedError
+
+    def detect(self, features, threshold):
+        """Return the Intervals of the frames to keep."""
+        meaningful_parts = self.keep(features, threshold)
+        # merge only gaps strictly shorter than min_silence
+        gap = int(round(self.min_silence / self.frame_length)) - 1
+        return meaningful_parts.merge(gap) if gap >= 0 else meaningful_parts
+
+    def _frames(self, seconds):
+        return max(1, int(round(seconds / self.frame_length)))
+
+
+class LevelDetector(Detector):
+    name = 'level'
+    OPTIONS = ('metric', 'min_silence')
+
+    def __init__(self, frame_length, metric='pp', min_silence=0.0):
+        super().__init__(frame_length, min_silence)
+        self.metric = metric
+
+    @property
+    def cache_key(self):
+        # the same key as before there were other detectors, so that levels cached then are still used.
+        return self.metric
+
+    def features(self, blocks):
+        levels = [frame_levels(samples, frame_size, self.metric) for frame_size, samples in blocks]
+        if not levels:
+            return np.zeros(0, np.int32)
+        return np.concatenate(levels)
+
+    def keep(self, features, threshold):
+        return threshold_levels(features, threshold)
+
+
+class VoiceDetector(Detector):
+    name = 'vad'
+    OPTIONS = ('min_silence', 'hysteresis')
+    # the columns of the features: the energy of each frame in decibels relative to full scale, the fraction of its
+    # samples that cross zero, and by how many decibels the bands of its spectrum got louder since the last frame.
+    COLUMNS = ('energy', 'zcr', 'flux')
+
+    def __init__(self, frame_length, min_silence=MIN_SILENCE, hysteresis=HYSTERESIS):
+        super().__init__(frame_length, min_silence)
+        self.hysteresis = hysteresis
+
+    def features(self, blocks):
+        rows = []
+        previous = None  # the band powers of the last frame of the previous block
+        for frame_size, samples in blocks:
+            frames = _float_frames(samples, frame_size)
+            power = np.einsum('ij,ij->i', frames, frames) / frame_size
+            signs = np.signbit(frames)
+            zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_size
+            bands = _band_powers(frames)
+            if previous is None:
+                previous = bands[:1]
+            flux = np.maximum(np.diff(np.concatenate([previous, bands]), axis=0), 0).mean(axis=1)
+            previous = bands[-1:]
+            rows.append(np.stack([_decibels(power), zcr, flux], axis=1).astype(np.float32))
+        if not rows:
+            return np.zeros((0, len(self.COLUMNS)), np.float32)
+        return np.concatenate(rows)
+
+    def score(self, features):
+        """How much like speech each frame is, in units of SNR_SCALE decibels above the noise floor."""
+        energy, zcr, flux = features.astype(np.float64).T
+        score = (energy - self._noise_floor(energy)) / SNR_SCALE
+        # speech changes its spectrum all the time; hum, fans and other steady noise don't.
+        score += _moving_average(flux, self._frames(FLUX_WINDOW)) / FLUX_SCALE
+        # hiss crosses zero much more often than voiced speech does.
+        score -= np.maximum(zcr - NOISY_ZCR, 0) / NOISY_ZCR
+        return _median_filter(score, self._frames(SMOOTHING))
+
+    def keep(self, features, threshold):
+        if not len(features):
+            return Intervals(np.zeros((0, 2)), 0)
+        score = self.score(features)
+        # put the two thresholds either side of the one asked for, so that about the same amount is kept.
+        on = _percentile(score, min(threshold + self.hysteresis / 2, 1))
+        off = _percentile(score, max(threshold - self.hysteresis / 2, 0))
+        # a run starts at the first frame above on, and carries on until the score falls to off or below.  So every
+        # run is the end of a run of frames above off, starting from the first frame in it that is above on, and runs
+        # of frames above off that never get above on are dropped.
+        candidates = Intervals.from_levels(score, off)
+        above_on = np.append(np.flatnonzero(score > on), len(score))
+        starts = above_on[np.searchsorted(above_on, candidates.starts)]
+        found = starts < candidates.ends
+        return Intervals(np.stack([starts[found], candidates.ends[found]], axis=1), len(score))
+
+    def _noise_floor(self, energy):
+        second = self._frames(1)
+        seconds = -(-len(energy) // second)
+        padded = np.pad(energy, (0, seconds * second - len(energy)), 'edge').reshape(seconds, second)
+        k = int(second * NOISE_PERCENTILE)
+        floor = np.partition(padded, k, axis=1)[:, k]
+        floor = sliding_window_view(np.pad(floor, NOISE_WINDOW, 'edge'), 2 * NOISE_WINDOW + 1).min(axis=1)
+        return np.repeat(floor, second)[:len(energy)]
+
+
+DETECTORS = {cls.name: cls for cls in (LevelDetector, VoiceDetector)}
+
+
+def create(name, frame_length, **options):
+    """Create the detector called name.  Options it doesn't take, and options that are None, are left out, so the same
+    options can be passed whichever detector is chosen."""
+    cls = DETECTORS[name]
+    return cls(frame_length, **{k: v for k, v in options.items() if k in cls.OPTIONS and v is not None})
+
+
+def _float_frames(samples, frame_size):
+    """The samples as (frames, frame_size) floats between -1 and 1, with the last frame padded with silence."""
+    if samples.dtype == np.uint8:
+        samples = samples.astype(np.float64) - 128
+        scale = 128
+    else:
+        scale = 1 << (8 * samples.dtype.itemsize - 1)
+    frames = -(-len(samples) // frame_size)
+    padded = np.zeros(frames * frame_size)
+    padded[:len(samples)] = samples
+    padded /= scale
+    return padded.reshape(frames, frame_size)
+
+
+_windows = {}
+
+
+def _band_powers(frames):
+    """The power of FLUX_BANDS equal bands of the spectrum of each frame, in decibels.  Summing the bins into bands
+    evens out the random variation from frame to frame in the spectrum of noise, which would otherwise look like
+    flux."""
+    size = frames.shape[1]
+    if size not in _windows:
+        _windows[size] = np.hanning(size)
+    spectrum = np.fft.rfft(frames * _windows[size], axis=1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    edges = np.linspace(0, power.shape[1], FLUX_BANDS + 1).astype(int)[:-1]
+    return _decibels(np.add.reduceat(power, edges, axis=1))
+
+
+def _decibels(power):
+    return 10 * np.log10(power + 1e-10)
+
+
+def _moving_average(values, width):
+    if width <= 1:
+        return values
+    sums = np.cumsum(np.pad(values, (width // 2, width - 1 - width // 2), 'edge'))
+    sums = np.concatenate(([0], sums))
+    return (sums[width:] - sums[:-width]) / width
+
+
+def _median_filter(values, width):
+    if width <= 1:
+        return values
+    return np.median(sliding_window_view(np.pad(values, (width // 2, width - 1 - width // 2), 'edge'), width), axis=1)
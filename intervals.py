@@ -0,0 +1,126 @@
+import numpy as np
+from nonlinear_time import bisect_expr
+
+
+class Intervals:
+    """The parts of a timeline that should be kept, as a sorted array of non-overlapping [start, end) ranges of
+    FRAME_LENGTH frames, out of a timeline that is `length` frames long.
+
+    This replaces the list of one bool per frame that used to be passed around: everything here takes time
+    proportional to the number of runs of sound rather than to the length of the media.
+    """
+    def __init__(self, bounds, length):
+        self.bounds = np.asarray(bounds, np.int64).reshape(-1, 2)
+        self.length = length
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask, bool)
+        # pad with False on both sides so that every run has a rising edge and a falling edge, then the indices where
+        # the mask changes are the starts and ends of the runs, alternately.
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+        return cls(edges.reshape(-1, 2), len(mask))
+
+    @classmethod
+    def from_levels(cls, levels, threshold):
+        """Keep every frame whose level is above threshold."""
+        return cls.from_mask(np.asarray(levels) > threshold)
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __iter__(self):
+        return ((int(start), int(end)) for start, end in self.bounds)
+
+    def __repr__(self):
+        return 'Intervals(%r, %d)' % (self.bounds.tolist(), self.length)
+
+    @property
+    def starts(self):
+        return self.bounds[:, 0]
+
+    @property
+    def ends(self):
+        return self.bounds[:, 1]
+
+    def total(self):
+        """Number of frames that are kept."""
+        return int((self.ends - self.starts).sum())
+
+    def keep_ratio(self):
+        return self.total() / self.length if self.length else 0.0
+
+    def dilate(self, before, after=None):
+        """Grow every interval by `before` frames at the start and `after` (default: the same as before) frames at the
+        end, merging any that end up touching.  This is how padding is added around sounded portions."""
+        if after is None:
+            after = before
+        bounds = self.bounds + (-before, after)
+        np.clip(bounds, 0, self.length, out=bounds)
+        return Intervals(bounds, self.length).merge()
+
+    def merge(self, gap=0):
+        """Merge intervals that overlap or that are separated by no more than gap frames."""
+        if not len(self):
+            return self
+        # the ends of the intervals might not be sorted if they overlap, so compare each start against the furthest
+        # end seen so far.
+        furthest_end = np.maximum.accumulate(self.ends)
+        new_run = np.concatenate(([True], self.starts[1:] > furthest_end[:-1] + gap))
+        starts = self.starts[new_run]
+        ends = np.maximum.reduceat(self.ends, np.flatnonzero(new_run))
+        return Intervals(np.stack([starts, ends], axis=1), self.length)
+
+    def drop_shorter_than(self, frames):
+        """Discard intervals that are less than frames long."""
+        return Intervals(self.bounds[self.ends - self.starts >= frames], self.length)
+
+    def runs(self):
+        """Yield (is_kept, run_length) for every run of kept or discarded frames, in order, like the loop over the bool
+        mask it replaced (benchmark._legacy_find_runs)."""
+        pos = 0
+        for start, end in self:
+            if start > pos:
+                yield False, start - pos
+            yield True, end - start
+            pos = end
+        if pos < self.length:
+            yield False, self.length - pos
+
+    def timeline(self, frame_length, sound_speed, silent_speed):
+        """Return the [(start_time, speed), ...] list that NonLinearTime is built from."""
+        timeline = []
+        time = 0
+        for is_kept, run_length in self.runs():
+            timeline.append((time * frame_length, sound_speed if is_kept else silent_speed))
+            time += run_length
+        return timeline
+
+    def to_mask(self):
+        mask = np.zeros(self.length, bool)
+        for start, end in self.bounds:
+            mask[start:end] = True
+        return mask
+
+    def select_expr(self, frame_length):
+        """ffmpeg expression for the select filter that is 1 for frames whose timestamp t falls in a kept interval and
+        0 otherwise."""
+        splits = ['%.3f' % (x * frame_length) for x in self.bounds.flat]
+        leaves = ['0', '1'] * len(self) + ['0']
+        if len(self) and self.ends[-1] == self.length:
+            # keep going to the end of the video, even if it runs past the end of the audio we measured.
+            splits.pop()
+            leaves.pop()
+        return bisect_expr('t', splits, leaves)
+
+    def setpts_expr(self, frame_length, sound_speed=1):
+        """ffmpeg expression for the setpts filter that moves each frame that survived select_expr to its place in
+        the output, i.e. closes up the gaps left by the discarded intervals."""
+        if not len(self):
+            return 'PTS'
+        lengths = (self.ends - self.starts) * sound_speed
+        output_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        splits = ['%.3f' % (x * frame_length) for x in self.starts[1:]]
+        leaves = ['(PTS-%.3f/TB)*%s+%.3f/TB' % (start * frame_length, sound_speed, output_start * frame_length)
+                  for start, output_start in zip(self.starts, output_starts)]
+        return bisect_expr('T', splits, leaves)
@@ -2,63 +2,177 @@ import os
 import subprocess
 import tempfile
 import wave
-import audioop
 import re
+import struct
+import errno
+import mmap
+import sys
+import threading
+import concurrent.futures
+import contextlib
+import numpy as np
+import detectors
+import profiling
+import subtitle_formats
 from nonlinear_time import NonLinearTime
-import shutil
+from intervals import Intervals
+from analysis_cache import LevelCache, CACHE_DIR
+from detectors import threshold_levels
+import workdir
+from workdir import WorkDir
 import glob
 
 FRAME_LENGTH = 0.01
 THRESHOLD = 0.7
+# number of FRAME_LENGTH frames of audio that are read and analysed in one go (one minute at 10ms frames)
+BLOCK_FRAMES = 6000
+_SAMPLE_DTYPES = {1: np.uint8, 2: np.dtype('<i2'), 4: np.dtype('<i4')}
 
 SHOWINFO_RE = re.compile(r'^\[Parsed_showinfo_0.*] n:\s*(?P<n>\d+).*pts_time:(?P<time>[0-9.]+)')
+# how the setpts video engine encodes the video.  The chunks are joined without re-encoding, so this is the codec of
+# the output.
+VIDEO_CODEC_ARGS = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+# the containers that can hold what VIDEO_CODEC_ARGS makes.  Anything else is encoded with its container's default codec
+# (VP9 for .webm, Theora for .ogv, ...) by both engines, see output_codec_args.
+H264_CONTAINERS = ('.mp4', '.m4v', '.mkv', '.mov', '.ts')
+# the progress line ffmpeg prints with -stats, e.g. "frame= 1234 fps=250 q=28.0 size= 1024kB time=00:00:41.13 ..."
+STATS_RE = re.compile(r'frame=\s*(?P<frame>\d+).*time=\s*(?P<time>\S+)')
 
 
-def find_meaningful_audio(file, threshold):
+def find_meaningful_audio(file, threshold, metric='pp'):
+    return threshold_levels(scan_audio_levels(file, metric), threshold)
+
+
+def scan_audio_levels(file, metric='pp'):
+    """Return an array with the loudness of every FRAME_LENGTH seconds of the audio track of file.
+
+    metric is 'pp' for the peak-to-peak distance (the loudest minus the quietest sample) or 'rms' for the root mean
+    square of the samples.
+
+    file may also be a DecodedAudio, in which case the levels are computed from the already decoded samples (downmixed
+    to mono) instead of running ffmpeg again.
+    """
+    return detectors.LevelDetector(FRAME_LENGTH, metric).features(mono_blocks(file))
+
+
+def mono_blocks(file):
+    """Yield (frame_size, samples) for the audio track of file (or a DecodedAudio), downmixed to mono, in blocks of
+    BLOCK_FRAMES frames of FRAME_LENGTH seconds, where frame_size is the number of samples in a frame.  This is what
+    detectors take their features from."""
+    if isinstance(file, DecodedAudio):
+        yield from file.mono_blocks()
+        return
     # extract the audio track from the file as mono wave sound
-    proc = subprocess.Popen(
+    proc = profiling.Process(
+        'read audio for scan',
         ['ffmpeg', '-hide_banner', '-loglevel', 'warning',
-         '-i', file, '-f', 'wav', '-ac', '1', '-'],
+         '-i', file, '-f', 'wav', '-ac', '1', '-acodec', 'pcm_s16le', '-'],
         stdout=subprocess.PIPE,
         stderr=subprocess.DEVNULL)
-    # for each FRAME_LENGTH seconds of audio, record the maximum peak-to-peak distance (audio_op.maxpp)
-    # (aka the loudness of the sample)
-    with wave.open(proc.stdout) as wf:
-        wf: wave.Wave_read
-        frame_size = int(FRAME_LENGTH * wf.getframerate())
-        width = wf.getsampwidth()
-        levels = []
-        data = wf.readframes(frame_size)
-        while data:
-            levels.append(audioop.maxpp(data, width))
-            data = wf.readframes(frame_size)
-
-    # threshold is the percentage of audio frames that should be false, so 0.3 will mark approximately 70% of the audio
-    # as meaningful
-    # to implement this, we sort all the values we just extracted and pick the [threshold]th value of the sorted list
-    # as our minimum level.
-    s = sorted(levels)
-    threshold = s[int(len(s) * threshold)]
-    return [x > threshold for x in levels]
-
-
-def add_padding(l, padding):
-    state = l[0]
-    i = 1
-    while i < len(l):
-        if l[i] != state:
-            if not state:  # rising edge, add padding before
-                for j in range(max(0, i - padding), i): l[j] = True
-            else:  # falling edge, add padding after
-                for j in range(i, min(i + padding, len(l))): l[j] = True
-                i += padding
-                if i >= len(l): break
-            state = l[i]
-        i += 1
-
-
-def _jumpcut_audio(fin, fout, should_keep):
-    proc = subprocess.Popen(
+    try:
+        with wave.open(proc.stdout) as wf:
+            yield from _wave_blocks(wf)
+    finally:
+        proc.wait()
+
+
+def _wave_blocks(wf: wave.Wave_read):
+    # rather than asking the wave module for 10ms at a time, read a large block of frames at once, so that detectors can
+    # let numpy work on every frame in the block in a single call.
+    frame_size = int(FRAME_LENGTH * wf.getframerate())
+    dtype = _SAMPLE_DTYPES[wf.getsampwidth()]
+    data = wf.readframes(frame_size * BLOCK_FRAMES)
+    while data:
+        yield frame_size, np.frombuffer(data, dtype)
+        data = wf.readframes(frame_size * BLOCK_FRAMES)
+
+
+def _wave_levels(wf: wave.Wave_read, metric='pp'):
+    return detectors.LevelDetector(FRAME_LENGTH, metric).features(_wave_blocks(wf))
+
+
+class DecodedAudio:
+    """The audio track of a file, decoded once by ffmpeg into a wave file on disk and memory-mapped, so that it can be
+    both analysed and cut without decoding it a second time.
+
+    samples is a read-only (frames, channels) numpy array backed by the wave file.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            nchannels, sampwidth, framerate, offset, size = _read_wav_layout(f)
+        self.nchannels = nchannels
+        self.sampwidth = sampwidth
+        self.framerate = framerate
+        self.data_offset = offset
+        # the data chunk of a file that ffmpeg didn't get to finalise may claim to be bigger than it is.
+        nframes = min(size, os.path.getsize(path) - offset) // (nchannels * sampwidth)
+        self.samples = np.memmap(path, _SAMPLE_DTYPES[sampwidth], 'r', offset, (nframes, nchannels))
+
+    @property
+    def frame_size(self):
+        return int(FRAME_LENGTH * self.framerate)
+
+    def levels(self, metric='pp'):
+        return detectors.LevelDetector(FRAME_LENGTH, metric).features(self.mono_blocks())
+
+    def mono_blocks(self):
+        """Yield (frame_size, samples) for the samples downmixed to mono, in blocks of BLOCK_FRAMES frames."""
+        step = self.frame_size * BLOCK_FRAMES
+        for start in range(0, len(self.samples), step):
+            block = self.samples[start:start + step]
+            if self.nchannels == 1:
+                yield self.frame_size, block[:, 0]
+            else:
+                # widen before summing so that adding the channels together can't overflow.
+                yield self.frame_size, (block.sum(axis=1, dtype=np.int64) // self.nchannels).astype(block.dtype)
+
+
+def decode_audio(file, tempdir):
+    """Decode the audio track of file into tempdir and return it as a DecodedAudio."""
+    path = os.path.join(tempdir, 'decoded.wav')
+    profiling.check_call('decode audio',
+                         ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'warning',
+                          '-i', file, '-vn', '-acodec', 'pcm_s16le',
+                          # switch to the 64 bit variant of the wave format if the audio is over 4GB
+                          '-rf64', 'auto', path],
+                         stderr=subprocess.DEVNULL)
+    return DecodedAudio(path)
+
+
+def _read_wav_layout(f):
+    """Walk the chunks of a (RIFF or RF64) wave file and return (channels, sample width, frame rate, data offset,
+    data size)."""
+    riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+    if riff not in (b'RIFF', b'RF64') or wave_id != b'WAVE':
+        raise ValueError('not a wave file')
+    fmt = None
+    data_size_64 = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError('wave file has no data chunk')
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        if chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('wave file has no fmt chunk')
+            if data_size_64 is not None and chunk_size == 0xFFFFFFFF:
+                chunk_size = data_size_64
+            return fmt + (f.tell(), chunk_size)
+        body = f.read(chunk_size + (chunk_size & 1))
+        if chunk_id == b'fmt ':
+            _, nchannels, framerate, _, _, bits = struct.unpack_from('<HHIIHH', body)
+            fmt = (nchannels, bits // 8, framerate)
+        elif chunk_id == b'ds64':
+            _, data_size_64 = struct.unpack_from('<QQ', body)
+
+
+def _jumpcut_audio(fin, fout, should_keep: Intervals):
+    if isinstance(fin, DecodedAudio):
+        _jumpcut_decoded_audio(fin, fout, should_keep)
+        return
+    proc = profiling.Process(
+        'read audio for cut',
         ['ffmpeg', '-hide_banner', '-loglevel', 'warning',
          '-i', fin, '-f', 'wav', '-'],
         stdout=subprocess.PIPE,
@@ -70,34 +184,94 @@ def _jumpcut_audio(fin, fout, should_keep):
         fout.setsampwidth(fin.getsampwidth())
         fout.setframerate(fin.getframerate())
         frame_size = int(FRAME_LENGTH * fin.getframerate())
-        should_keep = iter(should_keep)
-        data = fin.readframes(frame_size)
-        while data:
-            sk = next(should_keep, None)
-            if sk is None:
-                print('out of SK')
-                sk = True
-            if sk:
+        for keep, run_length in should_keep.runs():
+            data = fin.readframes(run_length * frame_size)
+            if keep:
                 # writeframesraw() is identical to writeframes() but does not update the header, which is important
                 # if the output stream is unseekable.
                 fout.writeframesraw(data)
-            data = fin.readframes(frame_size)
-        assert next(should_keep, None) is None
-
-
-def find_runs(l):
-    output = []
-    current_state = l[0]
-    run = 1
-    for element in l[1:]:
-        if element != current_state:
-            output.append((current_state, run))
-            current_state = element
-            run = 1
-        else:
-            run += 1
-    output.append((current_state, run))
-    return output
+        # keep anything past the end of should_keep
+        data = fin.readframes(BLOCK_FRAMES * frame_size)
+        while data:
+            fout.writeframesraw(data)
+            data = fin.readframes(BLOCK_FRAMES * frame_size)
+    proc.wait()
+
+
+def _jumpcut_decoded_audio(audio: DecodedAudio, fout, should_keep: Intervals):
+    # every kept run is one contiguous range of bytes in the decoded wave file, so rather than handing samples through
+    # python, ask the kernel to copy each run straight from one file to the other.
+    bytes_per_frame = audio.nchannels * audio.sampwidth * audio.frame_size
+    end_of_data = audio.data_offset + len(audio.samples) * audio.nchannels * audio.sampwidth
+    # anything past the end of should_keep is kept, as in _jumpcut_audio
+    runs = list(should_keep) + [(should_keep.length, None)]
+    with open(audio.path, 'rb') as src, open(fout, 'wb', buffering=0) as dst:
+        # leave room for the header now and fill it in once we know how much data we wrote.
+        dst.write(bytes(_WAV_HEADER_SIZE))
+        written = 0
+        for start, end in runs:
+            start = min(audio.data_offset + start * bytes_per_frame, end_of_data)
+            end = end_of_data if end is None else min(audio.data_offset + end * bytes_per_frame, end_of_data)
+            _copy_range(src, dst, start, end - start)
+            written += end - start
+        dst.seek(0)
+        dst.write(_wav_header(audio.nchannels, audio.sampwidth, audio.framerate, written))
+
+
+# RIFF header, a JUNK chunk that is turned into a ds64 chunk if the data is too big for a RIFF file, the fmt chunk and
+# the header of the data chunk.
+_WAV_HEADER_SIZE = 12 + 8 + 28 + 8 + 16 + 8
+
+
+def _wav_header(nchannels, sampwidth, framerate, data_size):
+    """Return a _WAV_HEADER_SIZE byte header for a PCM wave file with data_size bytes of samples, in the 64 bit RF64
+    variant of the format if data_size doesn't fit in 32 bits."""
+    riff_size = _WAV_HEADER_SIZE - 8 + data_size
+    fmt = struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, nchannels, framerate, framerate * nchannels * sampwidth,
+                      nchannels * sampwidth, sampwidth * 8)
+    if riff_size < 0xFFFFFFFF:
+        return (struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE') + struct.pack('<4sI', b'JUNK', 28) + bytes(28)
+                + fmt + struct.pack('<4sI', b'data', data_size))
+    nframes = data_size // (nchannels * sampwidth)
+    return (struct.pack('<4sI4s', b'RF64', 0xFFFFFFFF, b'WAVE')
+            + struct.pack('<4sIQQQI', b'ds64', 28, riff_size, data_size, nframes, 0)
+            + fmt + struct.pack('<4sI', b'data', 0xFFFFFFFF))
+
+
+def _copy_range(src, dst, offset, count):
+    """Copy count bytes from offset in src to the current position of dst, using copy_file_range() or sendfile() where
+    the OS supports them (which avoids copying the data into userspace at all) and a memory map otherwise."""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while count:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), count, offset)
+                if not n:
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError as e:
+            # e.g. copying between filesystems on older kernels.  Fall back to the next method.
+            if e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                raise
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):  # other platforms can only send to sockets
+        try:
+            while count:
+                n = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+                if not n:
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+    if count:
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            step = 1 << 24
+            for pos in range(offset, offset + count, step):
+                with view[pos:min(pos + step, offset + count)] as chunk:
+                    dst.write(chunk)
 
 
 def extract_frames(file, tempdir, start, length, framerate, start_number):
@@ -126,92 +300,286 @@ SOUND_SPEED = 1.0
 SILENT_SPEED = 0.1
 
 
-def audio_only(file, outfile, threshold=0.3, padding_time=0.05):
-    print('Scanning audio...', end='')
-    meaningful_parts = find_meaningful_audio(file, threshold)
-    print('done (keep %f%%).' % (sum(meaningful_parts) * 100 / len(meaningful_parts)))
-    print('Locating speech...', end='')
-    add_padding(meaningful_parts, int(padding_time / FRAME_LENGTH))
-    print('done (keep %f%%).' % (sum(meaningful_parts) * 100 / len(meaningful_parts)))
-    print('Generating output...')
-    _jumpcut_audio(file, outfile, meaningful_parts)
-    print('done.')
+def audio_only(file, outfile, threshold=0.3, padding_time=0.05, metric='pp', single_decode=True, use_cache=True,
+               detector=None):
+    detector = _detector(detector, metric)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio = decode_audio(file, tmpdir) if single_decode else file
+        meaningful_parts = _detect(detector, _analyse(file, audio, detector, use_cache), threshold)
+        print('done (keep %f%%, %d runs).' % (meaningful_parts.keep_ratio() * 100, len(meaningful_parts)))
+        print('Locating speech...', end='')
+        meaningful_parts = _dilate(meaningful_parts, padding_time)
+        print('done (keep %f%%, %d runs).' % (meaningful_parts.keep_ratio() * 100, len(meaningful_parts)))
+        print('Generating output...')
+        with profiling.stage('cut audio', frames=meaningful_parts.total()):
+            _jumpcut_audio(audio, outfile, meaningful_parts)
+        print('done.')
 
 
-def jumpcut(file, outfile, threshold=0.7, padding_time=0.02, sound_speed=1, silent_speed=0, subtitles=None):
-    print('Scanning audio...', end='', flush=True)
-    meaningful_parts = find_meaningful_audio(file, threshold)
-    print('done (keep %f%%).' % (sum(meaningful_parts) * 100 / len(meaningful_parts)))
-    print('Locating speech...', end='', flush=True)
-    add_padding(meaningful_parts, int(padding_time / FRAME_LENGTH))
-    print('done (keep %f%%).' % (sum(meaningful_parts) * 100 / len(meaningful_parts)))
-    print('Building timeline...')
-    timeline = []
-    time = 0
-    for is_meaningful, run_length in find_runs(meaningful_parts):
-        timeline.append((time * FRAME_LENGTH, sound_speed if is_meaningful else silent_speed))
-        time += run_length
-    converter = NonLinearTime(timeline)
+def jumpcut(file, outfile, threshold=0.7, padding_time=0.02, sound_speed=1, silent_speed=0, subtitles=None,
+            metric='pp', single_decode=True, jobs=None, video_engine='auto', use_cache=True, detector=None,
+            work_dir=None):
+    """Cut the silence out of file (or speed it up) into outfile.  detector is the detectors.Detector that decides
+    what is silence; by default it's the level detector with metric.
+
+    The intermediate files go in a temporary directory or, with work_dir, in that directory, where they are kept with
+    a manifest of the stages that are finished (see workdir.WorkDir).  Running the same jumpcut again with the same
+    work_dir then only does what didn't get done, down to the individual video chunks.
+    """
+    detector = _detector(detector, metric)
+    with tempfile.TemporaryDirectory() if work_dir is None else contextlib.nullcontext(work_dir) as tmpdir:
+        work = WorkDir(tmpdir, file, manifest=work_dir is not None)
+        _jumpcut(file, outfile, work, threshold, padding_time, sound_speed, silent_speed, subtitles, detector,
+                 single_decode, jobs, video_engine, use_cache)
 
-    # TODO implement audio time stretching
-    assert sound_speed == 1 and silent_speed == 0
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        print('Processing subtitles...', end='', flush=True)
-        if subtitles is None:
-            rc = subprocess.run(['ffmpeg', '-i', file, os.path.join(tmpdir, 'subtitles.ass')], stderr=subprocess.DEVNULL).returncode
-            if rc == 0:  # ffmpeg will return 1 if there is no subtitle stream.
-                subtitles = os.path.join(tmpdir, 'subtitles.ass')
-        elif not subtitles.endswith('.ass'):
-            subprocess.check_call(['ffmpeg', '-i', subtitles, os.path.join(tmpdir, 'subtitles.ass')], stderr=subprocess.DEVNULL)
-            subtitles = os.path.join(tmpdir, 'subtitles.ass') 
-        if subtitles:
-            with open(subtitles) as fin, open(os.path.join(tmpdir, 'converted.ass'), 'w') as fout:
-                process_subtitles(fin, fout, converter)
-            print('done.')
+def _detector(detector, metric):
+    return detector or detectors.LevelDetector(FRAME_LENGTH, metric)
+
+
+def _analyse(file, audio, detector, use_cache):
+    """Return detector's features of file, from the analysis cache if possible.  audio is what to scan if they aren't
+    cached: file itself or a DecodedAudio of it.  Prints the start of the "Scanning audio..." message; the caller
+    finishes it."""
+    cache = LevelCache() if use_cache else None
+    print('Scanning audio...', end='', flush=True)
+    with profiling.stage('scan audio', detector=detector.cache_key) as stats:
+        features = cache.get(file, FRAME_LENGTH, detector.cache_key) if cache else None
+        stats['cached'] = features is not None
+        if features is not None:
+            print('(cached) ', end='')
         else:
-            print('nothing to do.')
+            features = detector.features(mono_blocks(audio))
+            if cache:
+                cache.put(file, FRAME_LENGTH, detector.cache_key, features)
+        stats['frames'] = len(features)
+    return features
 
-        print('Processing audio...', end='', flush=True)
-        # TODO process the audio more intelligently
-        _jumpcut_audio(file, os.path.join(tmpdir, 'audio.wav'), meaningful_parts)
-        print('done.')
 
-        # Decrease this to 150 to 100 or 99 if your ffmpeg version doesn't like
-        # the long expressions.
-        pts_exprs = list(converter.generate_chunked_setpts_exprs(150))
-        print('Video will be processed in %d chunks.' % len(pts_exprs))
+def _detect(detector, features, threshold):
+    with profiling.stage('threshold', detector=detector.name, frames=len(features)) as stats:
+        meaningful_parts = detector.detect(features, threshold)
+        stats['runs'] = len(meaningful_parts)
+    return meaningful_parts
+
 
-        # process_video will print the "Processing..." messages on main's behalf
-        video_filtergraph = process_video(file, tmpdir, pts_exprs)
+def _dilate(meaningful_parts: Intervals, padding_time):
+    with profiling.stage('padding', frames=meaningful_parts.length) as stats:
+        meaningful_parts = meaningful_parts.dilate(int(padding_time / FRAME_LENGTH))
+        stats['runs'] = len(meaningful_parts)
+    return meaningful_parts
 
+
+def preview_thresholds(file, thresholds, padding_time=0.02, metric='pp', use_cache=True, detector=None):
+    """Print how much of file each threshold would keep, so that a good one can be picked without cutting anything.
+    With the analysis cache, running this again on the same file only costs the thresholding."""
+    detector = _detector(detector, metric)
+    features = _analyse(file, file, detector, use_cache)
+    print('done.')
+    padding = int(padding_time / FRAME_LENGTH)
+    print('threshold  keep%  keep% (padded)  cuts')
+    for threshold in thresholds:
+        meaningful_parts = detector.detect(features, threshold)
+        padded = meaningful_parts.dilate(padding)
+        print('%9.3f %6.2f %15.2f %5d' % (threshold, meaningful_parts.keep_ratio() * 100, padded.keep_ratio() * 100,
+                                           len(padded)))
+
+
+def _jumpcut(file, outfile, work: WorkDir, threshold, padding_time, sound_speed, silent_speed, subtitles, detector,
+             single_decode, jobs, video_engine, use_cache):
+    tmpdir = work.path
+    # with single_decode, the audio track is decoded once up front and both the analysis and the cutting read from
+    # that copy.  Otherwise ffmpeg decodes it once for each.
+    audio = file
+    if single_decode:
+        print('Decoding audio...', end='', flush=True)
+        audio = _decode_audio(work, file)
+        print('done.')
+    meaningful_parts = _find_speech(work, file, audio, detector, threshold, padding_time, use_cache)
+    print('Building timeline...')
+    # everything after this depends on the analysis only through the timeline, so that is what their keys are made of.
+    timeline = workdir.digest(meaningful_parts.bounds.tobytes(), meaningful_parts.length, sound_speed, silent_speed)
+    with profiling.stage('timeline', runs=len(meaningful_parts)):
+        converter = NonLinearTime.from_intervals(meaningful_parts, FRAME_LENGTH, sound_speed, silent_speed)
+    if not work.done('timeline', timeline):
+        work.finish('timeline', timeline, segments=len(converter.cache), duration=float(converter.output_times[-1]))
+
+    print('Processing subtitles...', end='', flush=True)
+    subtitles_key = {'timeline': timeline, 'subtitles': subtitles and workdir.identity(subtitles)}
+    with profiling.stage('subtitles') as stats:
+        if work.done('subtitles', subtitles_key):
+            print('(already done) ', end='')
+            subtitles = [(work.file(name), language) for name, language in work.data('subtitles')['tracks']]
+        else:
+            subtitles = prepare_subtitles(file, tmpdir, subtitles, converter)
+            tracks = [(os.path.basename(path), language) for path, language in subtitles]
+            work.finish('subtitles', subtitles_key, [name for name, _ in tracks], tracks=tracks)
+        stats['tracks'] = len(subtitles)
+    print('done.' if subtitles else 'nothing to do.')
+
+    print('Processing audio...', end='', flush=True)
+    with profiling.stage('cut audio') as stats:
+        if work.done('audio', timeline):
+            print('(already done) ', end='')
+        elif sound_speed == 1 and silent_speed == 0:
+            # nothing needs stretching, only cutting
+            stats['frames'] = meaningful_parts.total()
+            _jumpcut_audio(audio, os.path.join(tmpdir, 'audio.wav'), meaningful_parts)
+            work.finish('audio', timeline, ['audio.wav'])
+        else:
+            import timestretch
+            if not isinstance(audio, DecodedAudio):
+                audio = _decode_audio(work, file)
+            stats['samples'] = timestretch.stretch_audio(audio, os.path.join(tmpdir, 'audio.wav'), converter)
+            work.finish('audio', timeline, ['audio.wav'])
+    print('done.')
+
+    if video_engine == 'auto':
+        video_engine = 'select' if silent_speed == 0 else 'setpts'
+    output_key = {'timeline': timeline, 'subtitles': subtitles_key, 'engine': video_engine,
+                  'codec': output_codec_args(outfile), 'output': os.path.abspath(outfile)}
+    if work.done('output', output_key):
+        print('%s is already done.' % outfile)
+        return
+    if video_engine == 'select':
+        if silent_speed != 0:
+            raise ValueError('the select video engine can only remove silence, not speed it up')
         print('Encoding final result...')
-        subprocess.check_call(['ffmpeg', '-y', '-hide_banner',
-                                 '-filter_complex', video_filtergraph,
-                                 '-i', 'audio.wav']  # wave file of audio (which we are piping into ffmpeg)
-                                 + (['-i', 'converted.ass'] if subtitles else [])  # subtitle file
-                                 +[os.path.abspath(outfile)],
-                                stdin=subprocess.PIPE, cwd=tmpdir)
+        with profiling.stage('video', engine='select', runs=len(meaningful_parts)):
+            process_video_select(file, tmpdir, outfile, meaningful_parts, sound_speed, subtitles)
+        work.finish('output', output_key, [os.path.abspath(outfile)])
         print('done.')
+        return
+
+    with profiling.stage('setpts expressions', segments=len(converter.cache)) as stats:
+        pts_exprs = list(converter.generate_chunked_setpts_tree_exprs(rebase=True))
+        stats['chunks'] = len(pts_exprs)
+    print('Video will be processed in %d chunks.' % len(pts_exprs))
+
+    # process_video will print the "Processing..." messages on main's behalf
+    with profiling.stage('video', engine='setpts', chunks=len(pts_exprs)):
+        clips = process_video(file, tmpdir, pts_exprs, jobs, work)
+
+    print('Encoding final result...')
+    with profiling.stage('encode final'):
+        encode_final(tmpdir, outfile, clips, chunk_durations(converter, pts_exprs), subtitles)
+    work.finish('output', output_key, [os.path.abspath(outfile)])
+    print('done.')
 
 
-class _FakeTemporaryDirectory:
-    """Drop in replacement for tempfile.TemporaryDirectory that doesn't actually delete it when the program exits.
-    Useful for debugging.
+def _decode_audio(work: WorkDir, file):
+    """decode_audio into the work directory, unless that was already done."""
+    if work.done('decode'):
+        print('(already done) ', end='')
+        return DecodedAudio(work.file('decoded.wav'))
+    audio = decode_audio(file, work.path)
+    work.finish('decode', files=['decoded.wav'])
+    return audio
+
+
+def _find_speech(work: WorkDir, file, audio, detector, threshold, padding_time, use_cache):
+    """Detect the speech in file (scanning audio) and pad it, or load what was found last time with the same
+    settings."""
+    key = {'detector': detector.name, 'options': vars(detector), 'threshold': threshold, 'padding': padding_time}
+    if work.done('analysis', key):
+        meaningful_parts = Intervals(np.load(work.file('intervals.npy')), work.data('analysis')['length'])
+        print('Locating speech...(already done) done (keep %f%%, %d runs).' % (meaningful_parts.keep_ratio() * 100,
+                                                                             len(meaningful_parts)))
+        return meaningful_parts
+    meaningful_parts = _detect(detector, _analyse(file, audio, detector, use_cache), threshold)
+    print('done (keep %f%%, %d runs).' % (meaningful_parts.keep_ratio() * 100, len(meaningful_parts)))
+    print('Locating speech...', end='', flush=True)
+    meaningful_parts = _dilate(meaningful_parts, padding_time)
+    # every run is a cut, which is what the number of setpts chunks and the size of the select expression go by.
+    print('done (keep %f%%, %d runs).' % (meaningful_parts.keep_ratio() * 100, len(meaningful_parts)))
+    np.save(work.file('intervals.npy'), meaningful_parts.bounds)
+    work.finish('analysis', key, ['intervals.npy'], length=meaningful_parts.length,
+                keep_ratio=meaningful_parts.keep_ratio(), runs=len(meaningful_parts))
+    return meaningful_parts
+
+
+def prepare_subtitles(file, tmpdir, subtitles, converter: NonLinearTime):
+    """Retime the subtitle file subtitles, or if that is None every text subtitle track embedded in file, into tmpdir.
+    Returns a list of (retimed file, language or None), for encode_final or process_video_select to mux in.
+
+    ASS, SRT and WebVTT are retimed as they are, by subtitle_formats.  Only files in other formats go through ffmpeg,
+    to be converted to ASS first.
     """
-    def __init__(self, dir):
-        self.dir = dir
-    def __enter__(self):
-        # if os.path.exists(self.dir):
-        #     import shutil
-        #     shutil.rmtree(self.dir)
-        # os.mkdir(self.dir)
-        return self.dir
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-
-def process_video(input_file, tempdir, pts_exprs):
+    if subtitles is None:
+        tracks = subtitle_formats.extract_tracks(file, tmpdir)
+    else:
+        tracks = [(subtitles, subtitle_formats.detect_format(subtitles), None)]
+    retimed = []
+    for i, (path, fmt, language) in enumerate(tracks):
+        if fmt is None:
+            converted = os.path.join(tmpdir, 'subtitles%d.ass' % i)
+            profiling.check_call('convert subtitles', ['ffmpeg', '-y', '-i', path, converted],
+                                 stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            path, fmt = converted, 'ass'
+        out = os.path.join(tmpdir, 'converted%d.%s' % (i, fmt))
+        subtitle_formats.retime_file(path, out, converter, fmt)
+        retimed.append((out, language))
+    return retimed
+
+
+def subtitle_args(subtitles, first_input):
+    """The ffmpeg arguments that add the subtitles from prepare_subtitles as inputs (numbered from first_input), and
+    the ones that map them into the output."""
+    inputs = []
+    maps = []
+    for i, (path, language) in enumerate(subtitles):
+        inputs += ['-i', path]
+        maps += ['-map', str(first_input + i)]
+        if language:
+            maps += ['-metadata:s:s:%d' % i, 'language=' + language]
+    return inputs, maps
+
+
+def encode_final(tmpdir, outfile, clips, durations, subtitles):
+    """Join the video chunks from process_video end to end and mux them with the audio.wav that jumpcut left in tmpdir
+    and the subtitles from prepare_subtitles.
+
+    The chunks were already encoded with VIDEO_CODEC_ARGS, so if the output's container can hold that (see
+    output_codec_args) the concat demuxer copies them into it as they are instead of decoding and encoding the whole
+    video a second time.  Otherwise they are encoded again with the container's default codec.  Giving it the duration
+    of every chunk (from chunk_durations) stops a frame's worth of rounding per chunk from adding up into drift against
+    the audio.
+    """
+    with open(os.path.join(tmpdir, 'clips.txt'), 'w') as f:
+        f.write('ffconcat version 1.0\n')
+        for clip, duration in zip(clips, durations):
+            f.write('file %s\n' % os.path.basename(clip))
+            if duration is not None:
+                f.write('duration %.6f\n' % duration)
+    subtitle_inputs, subtitle_maps = subtitle_args(subtitles, 2)
+    profiling.check_call('join chunks',
+                         ['ffmpeg', '-y', '-hide_banner',
+                          '-f', 'concat', '-i', 'clips.txt',
+                          '-i', 'audio.wav']  # wave file of audio
+                         + subtitle_inputs
+                         + ['-map', '0:v', '-map', '1:a']
+                         + subtitle_maps
+                         + (['-c:v', 'copy'] if output_codec_args(outfile) else [])
+                         + [os.path.abspath(outfile)],
+                         stdin=subprocess.DEVNULL, cwd=tmpdir)
+
+
+def output_codec_args(outfile):
+    """The video codec options for outfile: VIDEO_CODEC_ARGS if its container is one of H264_CONTAINERS, otherwise none,
+    so that ffmpeg picks the container's default codec.  Both video engines encode with these, so they agree on what
+    an output is encoded with."""
+    if os.path.splitext(outfile)[1].lower() in H264_CONTAINERS:
+        return VIDEO_CODEC_ARGS
+    return []
+
+
+def chunk_durations(converter: NonLinearTime, pts_exprs):
+    """How long each chunk from generate_chunked_setpts_tree_exprs lasts in the output (None for the last one, which
+    simply lasts as long as it does)."""
+    return [None if end is None else converter.convert(end) - converter.convert(start) for start, end, _ in pts_exprs]
+
+
+def process_video(input_file, tempdir, pts_exprs, jobs=None, work: WorkDir = None):
     """
     Apply nonlinear speedup to the video portion.  We do this by altering the presentation timestamp (PTS) of each frame
     using ffmpeg's setpts filter, which takes an expression that ffmpeg will evaluate internally for every frame of the
@@ -240,40 +608,170 @@ def process_video(input_file, tempdir, pts_exprs):
 
     Due to the number of state transitions in the average video, these expressions quickly become so long and so complex
     that even after modifying and recompiling ffmpeg to increase the expression parser's arbitrary limit of 100 nested
-    sets of parentheses to 10,000 (hence the use of ./private_ffmpeg, which is our modified version), we are still
-    forced to break the expression into chunks because Linux won't let you pass a program an argument longer than 32,767
-    characters.
+    sets of parentheses to 10,000, we are still forced to break the expression into chunks because Linux won't let you
+    pass a program an argument longer than 32,767 characters.
 
-    To work around this, we break the video into chunks, then return some information to our caller as to how to tell
-    ffmpeg to stitch these chunks back together.
+    NonLinearTime.generate_chunked_setpts_tree_exprs gets around the nesting limit by arranging the ifs as a balanced
+    binary search rather than a chain (so a stock ffmpeg is fine again, and each frame only costs log2(n) comparisons),
+    but the length limit remains.
+
+    To work around this, we break the video into chunks, each encoded (once, with VIDEO_CODEC_ARGS) into its own clip
+    file, and return the list of clips for encode_final to join back together.  With a work directory, each clip is
+    recorded in its manifest as it is finished, and clips that were already finished with the same expression are
+    not encoded again.
 
     :param input_file:
     :param tempdir:
-    :param timestretch:
+    :param pts_exprs: (start, end, setpts expression) for each chunk, from
+                      NonLinearTime.generate_chunked_setpts_tree_exprs (or generate_chunked_setpts_exprs)
+    :param jobs: number of chunks to encode at once (default: one per CPU)
+    :param work: the WorkDir that tempdir belongs to, if any
     :return:
     """
     # start and end are in seconds since the start of the video.
-    # for an explanation of pts_expr please see timestretch.py
-    files = []
-    print('\x1b[s', end='')  # VT100 save cursor position
-    for i, (start, end, pts_expr) in enumerate(pts_exprs):
-        print('\x1b[uProcessing video (chunk %d of %d)...' % (i+1, len(pts_exprs)))
-        subprocess.check_call(['/home/seanw/PycharmProjects/jumpcutter/private_ffmpeg', '-y',
-                               '-loglevel', 'quiet',
-                               '-stats',
-                               # have 5 seconds of overlap between clips to avoid any possible missing spots
-                               '-ss', str(start)] +
-                               (['-to', str(end+5)] if end is not None else []) +
-                               ['-i', input_file,
-                               '-map', '0:v',  # ignore everything except the video track (no audio, no subtitles)
-                               '-vf', 'setpts='+pts_expr,
-                               os.path.join(tempdir, 'clip%02d.mkv' % (i+1))
-                               ])
-        files.append(os.path.join(tempdir, 'clip%02d.mkv' % (i+1)))
-    total_file_count = i+1
-    filters = ['movie=clip{0:02d}.mkv [v{0}]'.format(i+1) for i in range(total_file_count)]
-    filters.append(' '.join('[v{}]'.format(i+1) for i in range(total_file_count))+' interleave=n='+str(total_file_count))
-    return ';'.join(filters)
+    # for an explanation of pts_expr please see nonlinear_time.py
+    # the chunks are independent of each other, so encode up to `jobs` of them at once and split the CPU's threads
+    # between them.
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pts_exprs)))
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    files = [os.path.join(tempdir, 'clip%02d.mkv' % (i+1)) for i in range(len(pts_exprs))]
+    progress = _ChunkProgress(len(pts_exprs))
+    running = {}
+    lock = threading.Lock()
+    cancelled = threading.Event()
+
+    def encode(i, start, end, pts_expr):
+        # the clip only depends on its part of the timeline, which is what the expression (and where it starts and
+        # ends) describes.
+        key = {'start': start, 'end': end, 'expr': workdir.digest(pts_expr), 'codec': VIDEO_CODEC_ARGS}
+        name = os.path.basename(files[i])
+        if work is not None and work.done(name, key):
+            progress.finish(i)
+            return
+        if cancelled.is_set():
+            return
+        cmd = chunk_command(input_file, files[i], start, end, pts_expr, threads)
+        # text mode treats the \r that ffmpeg ends each -stats update with as a line ending, so we get one line per
+        # update.
+        proc = profiling.Process('chunk %d' % (i+1), cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, text=True, errors='replace')
+        with lock:
+            running[i] = proc
+            if cancelled.is_set():
+                proc.terminate()
+        errors = []
+        for line in proc.stderr:
+            match = STATS_RE.search(line)
+            if match:
+                progress.update(i, int(match.group('frame')))
+            elif line.strip():
+                errors.append(line.rstrip())
+        rc = proc.wait()
+        with lock:
+            del running[i]
+        if rc and not cancelled.is_set():
+            raise subprocess.CalledProcessError(rc, cmd, stderr='\n'.join(errors[-20:]))
+        if rc:
+            return
+        if work is not None:
+            work.finish(name, key, [name])
+        progress.finish(i)
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        futures = [pool.submit(encode, i, *chunk) for i, chunk in enumerate(pts_exprs)]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        except BaseException:
+            # one chunk failed (or we were interrupted), so there is no point finishing the others.
+            with lock:
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+                for proc in running.values():
+                    proc.terminate()
+            raise
+    print()
+    return files
+
+
+def chunk_command(input_file, outfile, start, end, pts_expr, threads):
+    """The ffmpeg command that encodes one chunk of process_video."""
+    return (['ffmpeg', '-y',
+             '-loglevel', 'error',
+             '-stats',
+             # the chunks are joined end to end, so each one has to stop exactly where the next one starts
+             '-ss', str(start)] +
+            (['-to', str(end)] if end is not None else []) +
+            ['-i', input_file,
+             '-map', '0:v',  # ignore everything except the video track (no audio, no subtitles)
+             '-vf', 'setpts='+pts_expr,
+             # setpts gives every frame in a removed portion the same timestamp; keep only one of them.
+             '-vsync', 'vfr'] +
+            VIDEO_CODEC_ARGS +
+            ['-threads', str(threads),
+             outfile])
+
+
+def absolute_input(file):
+    """file as an absolute path, for an ffmpeg that runs in another directory.  URLs (anything with a protocol, like
+    https://...) are left as they are."""
+    return file if '://' in file else os.path.abspath(file)
+
+
+def process_video_select(input_file, tempdir, outfile, intervals: Intervals, sound_speed=1, subtitles=()):
+    """
+    Remove the silent portions of the video with the select filter rather than setpts, and mux in the audio.wav that
+    jumpcut left in tempdir and the subtitles from prepare_subtitles.  This only works when the silent portions are
+    being cut out altogether (silent_speed == 0), but it runs on a stock ffmpeg, in a single pass, with no chunks.
+
+    select drops every frame whose timestamp isn't inside one of the intervals, then setpts shifts each surviving frame
+    back by the total length of the gaps before it.  Both expressions are balanced trees of if(lt(...)) (see
+    nonlinear_time.bisect_expr), which keeps them shallow enough for the stock expression parser and costs ffmpeg
+    O(log n) per frame to evaluate.  They are still far too long for the command line, so the filtergraph goes in a
+    file that is passed with -filter_complex_script.
+    """
+    script = os.path.abspath(os.path.join(tempdir, 'video_filter.txt'))
+    with open(script, 'w') as f:
+        f.write("[0:v]select='{}',setpts='{}'[v]".format(intervals.select_expr(FRAME_LENGTH),
+                                                          intervals.setpts_expr(FRAME_LENGTH, sound_speed)))
+    subtitle_inputs, subtitle_maps = subtitle_args(subtitles, 2)
+    profiling.check_call('select video',
+                         ['ffmpeg', '-y', '-hide_banner',
+                          # ffmpeg runs in tempdir, so a relative input has to be made absolute first
+                          '-i', absolute_input(input_file),
+                          '-i', 'audio.wav']
+                         + subtitle_inputs
+                         + ['-filter_complex_script', script,
+                            '-map', '[v]', '-map', '1:a']
+                         + subtitle_maps
+                         + output_codec_args(outfile)
+                         + [os.path.abspath(outfile)],
+                         stdin=subprocess.DEVNULL, cwd=tempdir)
+
+
+class _ChunkProgress:
+    """Combines the -stats output of the ffmpeg processes encoding each chunk into a single progress line."""
+    def __init__(self, total):
+        self.total = total
+        self.frames = [0] * total
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def update(self, chunk, frames):
+        with self.lock:
+            self.frames[chunk] = frames
+            self._print()
+
+    def finish(self, chunk):
+        with self.lock:
+            self.done += 1
+            self._print()
+
+    def _print(self):
+        print('\rProcessing video (%d of %d chunks done, %d frames encoded)...' % (self.done, self.total,
+                                                                                  sum(self.frames)),
+              end='', flush=True)
 
 
 
@@ -306,46 +804,9 @@ def process_frames(tempdir, timestretch:NonLinearTime, framerate):
 
 
 def process_subtitles(infile, outfile, converter: NonLinearTime):
-    # what comes before the actual subtitle events in a Advanced SubStation (ASS) file is some formatting information
-    # (what font to render the subtitles in, font size, color etc.)
-    # Copy that information verbatim.
-    for line in infile:
-        outfile.write(line)
-        if line.strip() == '[Events]':
-            break
-    start_idx = None
-    end_idx = None
-    num_parts = -1
-    for line in infile:
-        if not line or line.isspace():
-            break
-        type, sep, rest = line.partition(':')
-        if not sep:
-            outfile.write(type)
-            continue
-        parts = [x.strip() for x in rest.split(',', num_parts)]
-        if type == 'Format':
-            # the ASS format is somewhat flexible, and uses Format: rows
-            # to define what CSV columns are used in the rest of the file.
-            # Maintain these lines unchanged to the output.
-            outfile.write(line)
-            num_parts = len(parts) - 1
-            start_idx = parts.index('Start')
-            end_idx = parts.index('End')
-        elif type == 'Dialogue':
-            # rewrite the start and end time of the dialogue to match up with the changes we made to the video.
-            start_time = _from_ass_time(parts[start_idx])
-            start_time = converter.convert(start_time)
-            parts[start_idx] = _to_ass_time(start_time)
-
-            end_time = _from_ass_time(parts[end_idx])
-            end_time = converter.convert(end_time)
-            parts[end_idx] = _to_ass_time(end_time)
-            outfile.write('Dialogue: {}\n'.format(','.join(parts)))
-        else:
-            # if we don't know what to do with a line, jut put it through verbatim.
-            outfile.write(line)
-    shutil.copyfileobj(infile, outfile)
+    """Retime the events of the Advanced SubStation (ASS) file infile into outfile.  See subtitle_formats for this and
+    the other formats."""
+    subtitle_formats.retime_ass(infile, outfile, converter)
 
 
 def _from_ass_time(s):
@@ -380,6 +841,76 @@ if __name__=='__main__':
                                                             'Default: 1', default=1)
     parser.add_argument('--subtitle-file', help='Alternate subtitle file (default is to use the one baked into the '
                                                 'input file)', default=None)
+    parser.add_argument('--metric', choices=('pp', 'rms'), help='how to measure the loudness of each 10ms of audio: '
+                                                                'peak-to-peak distance (pp) or root mean square '
+                                                                '(rms).  Default: pp', default='pp')
+    parser.add_argument('--detector', choices=sorted(detectors.DETECTORS),
+                        help='how to tell speech from silence: by the loudness of each 10ms (level, see --metric) or '
+                             'with a voice activity detector (vad) that ignores clicks and steady background noise and '
+                             'gives fewer, longer runs of speech, so fewer cuts to encode.  Default: level',
+                        default='level')
+    parser.add_argument('--min-silence', type=float,
+                        help='merge runs of speech separated by less than N seconds of silence.  Higher values make '
+                             'fewer cuts.  Default: 0.2 with --detector vad, otherwise 0')
+    parser.add_argument('--hysteresis', type=float,
+                        help='with --detector vad, how much lower (as a fraction of the audio, like --threshold) the '
+                             'threshold for speech to stop is than the threshold for it to start.  Default: %g'
+                             % detectors.HYSTERESIS)
+    parser.add_argument('--no-single-decode', dest='single_decode', action='store_false',
+                        help='decode the audio twice (once to analyse it and once to cut it) rather than keeping a '
+                             'decoded copy in the temporary directory.  Slower, but uses less disk space.')
+    parser.add_argument('--jobs', '-j', type=int, help='number of video chunks to encode at the same time.  Default: '
+                                                       'the number of CPUs', default=None)
+    parser.add_argument('--video-engine', choices=('auto', 'setpts', 'select'),
+                        help='how to cut the video.  setpts retimes every frame in chunks that are encoded '
+                             'separately and then joined; select drops the silent frames in a single pass, but only '
+                             'works with --silent-speed 0.  Default: select if --silent-speed is 0, otherwise setpts',
+                        default='auto')
+    parser.add_argument('--stream', action='store_true',
+                        help='cut the input as it is read, into an HLS playlist in the directory output_file, judging '
+                             'the threshold against the last 10 minutes of audio rather than the whole file.  Use this '
+                             'for recordings that are still in progress.')
+    parser.add_argument('--follow', action='store_true',
+                        help='with --stream, keep waiting for the input file to grow until nothing has been written '
+                             'to it for 30 seconds.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help="don't read or write the cache of audio levels (kept in %s)" % CACHE_DIR)
+    parser.add_argument('--preview-thresholds', type=lambda s: [float(x) for x in s.split(',')], metavar='T1,T2,...',
+                        help="print how much of the input each of these thresholds would keep, then exit without "
+                             "writing any output")
+    parser.add_argument('--work-dir', metavar='DIR',
+                        help='keep the intermediate files (decoded audio, cut audio, subtitles and video chunks) in '
+                             'DIR instead of a temporary directory, with a manifest of what is finished, so that if '
+                             'the jumpcut fails, running the same command again carries on from where it stopped.  '
+                             'DIR is left behind afterwards.')
+    parser.add_argument('--profile', metavar='TRACE_FILE',
+                        help='measure the time, CPU and I/O of every stage and every ffmpeg run, print a summary at the '
+                             'end and write the details to TRACE_FILE as a Chrome trace (open it in chrome://tracing '
+                             'or https://ui.perfetto.dev)')
     data = parser.parse_args()
-    jumpcut(data.input_file, data.output_file, data.threshold, data.padding, data.sounded_speed, data.silent_speed,
-            data.subtitle_file)
+    if data.stream and data.detector != 'level':
+        # the streaming detector judges each frame as it arrives against a sliding window of levels.
+        parser.error('--stream only works with --detector level')
+    trace = profiling.Trace()
+    if data.profile:
+        profiling.subscribe(trace)
+    detector = detectors.create(data.detector, FRAME_LENGTH, metric=data.metric, min_silence=data.min_silence,
+                                hysteresis=data.hysteresis)
+    try:
+        if data.preview_thresholds:
+            preview_thresholds(data.input_file, data.preview_thresholds, data.padding, data.metric, data.use_cache,
+                               detector)
+        elif data.stream:
+            import streaming
+            streaming.jumpcut_stream(data.input_file, data.output_file, data.threshold, data.padding,
+                                     metric=data.metric, follow=data.follow)
+        else:
+            jumpcut(data.input_file, data.output_file, data.threshold, data.padding, data.sounded_speed,
+                    data.silent_speed, data.subtitle_file, data.metric, data.single_decode, data.jobs,
+                    data.video_engine, data.use_cache, detector, data.work_dir)
+    finally:
+        # write the trace even if something failed, since that's when it is most interesting.
+        if data.profile:
+            profiling.unsubscribe(trace)
+            trace.write(data.profile)
+            print(trace.summary())
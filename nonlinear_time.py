@@ -1,20 +1,80 @@
 import bisect
+import re
+import numpy as np
+
+
+def bisect_expr(var, splits, leaves):
+    """Build an ffmpeg expression that evaluates to leaves[i] when splits[i-1] <= var < splits[i], as a balanced tree
+    of if(lt(...)) tests.  This nests log2(len(leaves)) levels deep instead of len(leaves) levels like a chain of ifs,
+    so ffmpeg does a binary search for every frame rather than a linear one, and even thousands of leaves stay well
+    under the stock expression parser's limit of 100 nested parentheses.
+
+    The commas in the result are not escaped, so it has to be single-quoted when used in a filtergraph.
+    """
+    assert len(leaves) == len(splits) + 1
+    if len(leaves) == 1:
+        return leaves[0]
+    mid = len(leaves) // 2
+    return 'if(lt({},{}),{},{})'.format(var, splits[mid - 1],
+                                        bisect_expr(var, splits[:mid - 1], leaves[:mid]),
+                                        bisect_expr(var, splits[mid:], leaves[mid:]))
 
 class NonLinearTime:
+    """Maps times in the input to times in the output, for a timeline given as [(start_time, relative_speed), ...].
+
+    Each (start_time, relative_speed) starts a segment of the input that lasts until the next one starts (the last one
+    lasts forever) and is played at relative_speed.  The segments are kept as numpy arrays with one element each:
+    times (where they start in the input), output_times (where they start in the output) and speeds, so that whole
+    arrays of timestamps can be converted at once with convert_many.
+    """
+    __slots__ = ('times', 'output_times', 'speeds', 'cache', '_time_list')
+
     def __init__(self, timeline):
-        self.cache = []
-        current_output_time = 0
-        for (start_time, relative_speed), (end_time, _) in zip(timeline, timeline[1:]):
-            self.cache.append((start_time, end_time, current_output_time, relative_speed))
-            current_output_time += (end_time - start_time) * relative_speed
-        self.cache.append((timeline[-1][0], None, current_output_time, timeline[-1][1]))
-        self.times = tuple(x[0] for x in self.cache)
+        self.times = np.array([start_time for start_time, _ in timeline], np.float64)
+        self.speeds = np.array([relative_speed for _, relative_speed in timeline], np.float64)
+        # cumsum adds up the segments in order, exactly like a running total would.
+        self.output_times = np.concatenate(([0], np.cumsum(np.diff(self.times) * self.speeds[:-1])))
+        # the same segments as plain python floats, for convert() and the expression generators, which look at one
+        # segment at a time: (start_time, end_time, output_time, relative_speed), with end_time None for the last one.
+        # bisect on a list is also much quicker than np.searchsorted for a single time.
+        self._time_list = self.times.tolist()
+        self.cache = list(zip(self._time_list, self._time_list[1:] + [None], self.output_times.tolist(),
+                              self.speeds.tolist()))
+
+    @classmethod
+    def from_intervals(cls, intervals, frame_length, sound_speed=1, silent_speed=0):
+        """Build the timeline straight from an intervals.Intervals of kept frames."""
+        return cls(intervals.timeline(frame_length, sound_speed, silent_speed))
 
     def convert(self, input_time):
-        index = bisect.bisect_left(self.times, input_time)-1
-        start_time, end_time, output_time, relative_speed = self.cache[index]
+        index = bisect.bisect_right(self._time_list, input_time) - 1
+        # times before the start of the timeline belong to the first segment.
+        start_time, _, output_time, relative_speed = self.cache[index if index > 0 else 0]
         return output_time + (input_time - start_time) * relative_speed
 
+    def convert_many(self, input_times):
+        """convert() every element of an array of input times at once."""
+        input_times = np.asarray(input_times, np.float64)
+        index = np.maximum(np.searchsorted(self.times, input_times, side='right') - 1, 0)
+        return self.output_times[index] + (input_times - self.times[index]) * self.speeds[index]
+
+    def invert(self, output_time):
+        """The input time that is playing at output_time in the output, i.e. where to seek to in the input to find
+        what is there.  Where the output skips over removed segments, that is the start of the segment after them."""
+        return float(self.invert_many(output_time))
+
+    def invert_many(self, output_times):
+        """invert() every element of an array of output times at once."""
+        output_times = np.asarray(output_times, np.float64)
+        # segments that were removed (speed 0) take up no output time, so they start where the next segment does.
+        # Searching to the right of equal output_times skips over them to the segment that actually plays.
+        index = np.maximum(np.searchsorted(self.output_times, output_times, side='right') - 1, 0)
+        speeds = self.speeds[index]
+        played = speeds > 0
+        offset = np.divide(output_times - self.output_times[index], speeds, out=np.zeros_like(output_times),
+                           where=played)
+        return self.times[index] + offset
+
     def generate_setpts_expr(self):
 
         # the expression we generate is:
@@ -78,3 +138,112 @@ class NonLinearTime:
         yield current_expr_start_time, end_time, last_good_expr
 
 
+
+    def generate_setpts_tree_expr(self):
+        """The same mapping as generate_setpts_expr, but as a balanced binary search over self.times (see bisect_expr)
+        instead of a chain of ifs, so it only nests log2(n) deep."""
+        return self._tree_expr(self.cache, 0)
+
+    def generate_chunked_setpts_tree_exprs(self, max_depth=100, max_length=32767, rebase=False):
+        """Like generate_chunked_setpts_exprs, but each chunk is a balanced tree, so chunks are only limited by
+        max_length rather than by the nesting depth, and a stock ffmpeg can evaluate them.
+
+        With rebase, each chunk's output timestamps start from 0 rather than from where the chunk falls in the whole
+        output, which is what the concat demuxer expects when the chunks are joined end to end."""
+        # each segment adds one leaf and one split to the tree.  Estimate the length of a chunk from the segments in
+        # it, then check the real thing and back off if the estimate was too optimistic.
+        segments = self.cache
+        first = 0
+        while first < len(segments):
+            chunk_start = segments[first][0]
+            output_start = segments[first][2] if rebase else 0
+            last = first + 1
+            length = 0
+            while last < len(segments):
+                length += (len(self._leaf_expr(segments[last], chunk_start, output_start))
+                           + len(r'if(lt(PTS\,000000.00/TB)\,\,)'))
+                if length >= max_length:
+                    break
+                last += 1
+            expr = self._tree_expr(segments[first:last], chunk_start, output_start)
+            while last - first > 1 and (len(expr) >= max_length or _depth(expr) >= max_depth):
+                last = first + (last - first) * 3 // 4
+                expr = self._tree_expr(segments[first:last], chunk_start, output_start)
+            yield chunk_start, segments[last][0] if last < len(segments) else None, expr
+            first = last
+
+    @staticmethod
+    def _leaf_expr(segment, chunk_start, output_start=0):
+        start_time, end_time, output_time, relative_speed = segment
+        return '{1:.2f}/TB+(PTS-{0:.2f}/TB)*{2}'.format(start_time - chunk_start, output_time - output_start,
+                                                        relative_speed)
+
+    def _tree_expr(self, segments, chunk_start, output_start=0):
+        # times are relative to chunk_start because process_video seeks to the start of each chunk, which makes
+        # ffmpeg start that chunk's PTS from 0.
+        splits = ['{:.2f}/TB'.format(segment[0] - chunk_start) for segment in segments[1:]]
+        leaves = [self._leaf_expr(segment, chunk_start, output_start) for segment in segments]
+        # ffmpeg makes you escape commas, since they are used to delimit the video filter list.
+        return bisect_expr('PTS', splits, leaves).replace(',', r'\,')
+
+
+def _depth(expr):
+    depth = max_depth = 0
+    for c in expr:
+        if c == '(':
+            depth += 1
+            max_depth = max(depth, max_depth)
+        elif c == ')':
+            depth -= 1
+    return max_depth
+
+
+_EXPR_TOKEN_RE = re.compile(r'[A-Za-z_]+|[0-9.]+|[-+*/(),]')
+_EXPR_FUNCTIONS = {'if': lambda c, a, b: a if c else b, 'lt': lambda a, b: float(a < b)}
+
+
+def eval_ffmpeg_expr(expr, **variables):
+    """Evaluate the subset of ffmpeg's expression language that our setpts and select expressions use (if, lt, + - *
+    / and parentheses), so that they can be checked without running ffmpeg (see test_nonlinear_time.py)."""
+    tokens = _EXPR_TOKEN_RE.findall(expr.replace('\\,', ','))
+    pos = 0
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def sum_():
+        value = product()
+        while peek() in ('+', '-'):
+            value = value + product() if take() == '+' else value - product()
+        return value
+
+    def product():
+        value = atom()
+        while peek() in ('*', '/'):
+            value = value * atom() if take() == '*' else value / atom()
+        return value
+
+    def atom():
+        token = take()
+        if token == '(':
+            value = sum_()
+            take()
+            return value
+        if token == '-':
+            return -atom()
+        if token[0].isdigit():
+            return float(token)
+        if peek() == '(':
+            take()
+            args = [sum_()]
+            while take() == ',':
+                args.append(sum_())
+            return _EXPR_FUNCTIONS[token](*args)
+        return variables[token]
+
+    return sum_()
@@ -0,0 +1,242 @@
+"""
+Measurements of where a jumpcut spends its time.
+
+Every stage of the pipeline (scanning the audio, cutting it, retiming the subtitles, ...) runs inside stage(), and
+every ffmpeg it starts is a Process.  When something is subscribed, each of them reports an event when it finishes:
+its wall time and CPU time, the bytes it read and wrote, counts like the number of frames it processed and, for ffmpeg
+children, the peak memory and the final statistics from ffmpeg's -progress output.  While an ffmpeg is running, its
+-progress updates are reported too.
+
+Events are dicts in the Chrome trace event format (https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU),
+so a Trace of them can be written to a file and opened in chrome://tracing or https://ui.perfetto.dev.  To watch a
+jumpcut from python:
+
+    def on_event(event):
+        if event['ph'] == 'X':
+            print(event['name'], event['dur'] / 1e6, event['args'])
+
+    profiling.subscribe(on_event)
+    main.jumpcut('in.mp4', 'out.mp4')
+    profiling.unsubscribe(on_event)
+
+When nothing is subscribed none of this is measured, and ffmpeg is run exactly as it would be without it.
+"""
+import collections
+import contextlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+_subscribers = []
+# ffmpeg commands can be tens of thousands of characters long (see main.process_video), which would bloat the trace.
+_MAX_COMMAND_LENGTH = 300
+# the -progress fields that are reported, and which of them go on the chart of the process's progress.
+_PROGRESS_FIELDS = ('frame', 'fps', 'total_size', 'out_time_us', 'speed')
+_PROGRESS_COUNTERS = ('frame', 'fps', 'speed')
+
+
+def subscribe(callback):
+    """Call callback(event) with every event from now on.  It is called from whichever thread the event happened on,
+    so it must be thread safe.  Returns callback, so this can be used as a decorator."""
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+def _emit(event):
+    for callback in list(_subscribers):
+        callback(event)
+
+
+def _now():
+    """The current time in microseconds, which is the unit of the timestamps in a Chrome trace."""
+    return time.perf_counter() * 1e6
+
+
+def _event(phase, name, category, ts, args, **fields):
+    event = {'name': name, 'cat': category, 'ph': phase, 'ts': ts, 'pid': os.getpid(),
+             'tid': threading.get_native_id(), 'args': args}
+    event.update(fields)
+    return event
+
+
+def _io_counters():
+    """(bytes read, bytes written) by this process so far, including through pipes, or None if the OS doesn't say."""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def stage(name, **args):
+    """Measure the body of the with statement as the stage called name.
+
+    Yields a dict (initially the keyword arguments) that the body can add counts to, such as the number of frames it
+    processed.  It becomes the args of the event, along with the CPU time and the bytes read and written.  These are
+    for the whole process, so they include anything done on other threads at the same time.
+    """
+    if not _subscribers:
+        yield args
+        return
+    start = _now()
+    cpu = time.process_time()
+    io = _io_counters()
+    try:
+        yield args
+    except BaseException as e:
+        args['error'] = type(e).__name__
+        raise
+    finally:
+        args['cpu_time'] = time.process_time() - cpu
+        end_io = _io_counters()
+        if io and end_io:
+            args['bytes_read'] = end_io[0] - io[0]
+            args['bytes_written'] = end_io[1] - io[1]
+        _emit(_event('X', name, 'stage', start, args, dur=_now() - start))
+
+
+class Process(subprocess.Popen):
+    """subprocess.Popen that reports the child as an event called name when it is waited for, with its CPU time, peak
+    memory and, if it's ffmpeg, the last statistics it printed to -progress.
+
+    The -progress output goes to a pipe of its own, so it doesn't get in the way of anything reading the child's
+    stdout or stderr.  Each update is also reported as it arrives, as a counter event.
+    """
+    def __init__(self, name, args, **kwargs):
+        self.name = name
+        self.stats = {}
+        self._start = _now()
+        self._reader = None
+        self._reported = False
+        # os.wait4 is how we get the child's resource usage.
+        self._profiled = bool(_subscribers) and hasattr(os, 'wait4')
+        if not (self._profiled and os.path.basename(args[0]) == 'ffmpeg'):
+            super().__init__(args, **kwargs)
+            return
+        read_fd, write_fd = os.pipe()
+        args = [args[0], '-progress', 'pipe:%d' % write_fd] + list(args[1:])
+        kwargs['pass_fds'] = tuple(kwargs.get('pass_fds', ())) + (write_fd,)
+        try:
+            super().__init__(args, **kwargs)
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        self._reader = threading.Thread(target=self._read_progress, args=(read_fd,), daemon=True)
+        self._reader.start()
+
+    def _read_progress(self, fd):
+        # -progress prints key=value lines, and a progress=continue (or progress=end) line after each complete update.
+        update = {}
+        with open(fd, errors='replace') as f:
+            for line in f:
+                key, _, value = line.strip().partition('=')
+                if key != 'progress':
+                    update[key] = value
+                    continue
+                self.stats.update((k, _number(update[k])) for k in _PROGRESS_FIELDS if k in update)
+                counters = {k: self.stats[k] for k in _PROGRESS_COUNTERS if self.stats.get(k) is not None}
+                if counters:
+                    _emit(_event('C', self.name, 'ffmpeg', _now(), counters))
+                update = {}
+
+    def wait(self, timeout=None):
+        rusage = None
+        if self._profiled and self.returncode is None and timeout is None:
+            try:
+                _, status, rusage = os.wait4(self.pid, 0)
+            except ChildProcessError:
+                pass  # another thread reaped it first, e.g. with poll() while terminating it
+            else:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        returncode = super().wait(timeout)
+        if self._profiled and not self._reported:
+            self._reported = True
+            self._report(rusage)
+        return returncode
+
+    def _report(self, rusage):
+        command = subprocess.list2cmdline(self.args)
+        if len(command) > _MAX_COMMAND_LENGTH:
+            command = command[:_MAX_COMMAND_LENGTH] + '...'
+        args = {'command': command, 'returncode': self.returncode}
+        if rusage is not None:
+            args.update(user_cpu_time=rusage.ru_utime, system_cpu_time=rusage.ru_stime,
+                        # ru_maxrss is in kilobytes on linux
+                        max_rss_bytes=rusage.ru_maxrss * 1024,
+                        blocks_read=rusage.ru_inblock, blocks_written=rusage.ru_oublock)
+        if self._reader is not None:
+            self._reader.join()
+            args.update((k, v) for k, v in self.stats.items() if v is not None)
+        _emit(_event('X', self.name, 'ffmpeg', self._start, args, dur=_now() - self._start))
+
+
+def _number(value):
+    """Parse a -progress value such as '1234', '29.97', '1.5x' or 'N/A'."""
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+def call(name, args, **kwargs):
+    """subprocess.call, with the child reported as name."""
+    with Process(name, args, **kwargs) as proc:
+        return proc.wait()
+
+
+def check_call(name, args, **kwargs):
+    """subprocess.check_call, with the child reported as name."""
+    returncode = call(name, args, **kwargs)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+class Trace:
+    """Collects every event while it is subscribed (which it is inside a with statement), to be written out as a
+    Chrome trace."""
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def __enter__(self):
+        subscribe(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        unsubscribe(self)
+
+    def write(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self):
+        """A table of the total wall time and CPU time of each stage and process, in the order they started."""
+        totals = collections.OrderedDict()
+        with self.lock:
+            spans = sorted((e for e in self.events if e['ph'] == 'X'), key=lambda e: e['ts'])
+        for event in spans:
+            args = event['args']
+            cpu = args.get('cpu_time', args.get('user_cpu_time', 0) + args.get('system_cpu_time', 0))
+            count, wall, total_cpu = totals.get((event['cat'], event['name']), (0, 0, 0))
+            totals[event['cat'], event['name']] = count + 1, wall + event['dur'] / 1e6, total_cpu + cpu
+        lines = ['%-40s %6s %10s %10s' % ('stage', 'count', 'wall (s)', 'cpu (s)')]
+        for (category, name), (count, wall, cpu) in totals.items():
+            label = name if category == 'stage' else '  ' + name
+            lines.append('%-40s %6d %10.3f %10.3f' % (label[:40], count, wall, cpu))
+        return '\n'.join(lines)
@@ -0,0 +1,228 @@
+"""
+Incremental jumpcutting for live or still-growing recordings.
+
+jumpcut() needs the whole file up front: the threshold is a percentile of every level in the file and the video is
+cut in one go at the end.  jumpcut_stream() instead reads the audio as it arrives, judges each frame against a
+percentile of a sliding window of recent levels, and as soon as enough of the timeline has been decided, cuts that
+stretch of the input into the next segment of an HLS playlist.  Only a fixed-size window of levels is ever kept in
+memory, so it can run for as long as the recording does.
+"""
+import math
+import os
+import subprocess
+import numpy as np
+from intervals import Intervals
+import detectors
+import main
+import profiling
+
+# sample rate the audio is resampled to for analysis.  Its value only affects how many samples make up a frame.
+ANALYSIS_RATE = 48000
+# number of FRAME_LENGTH frames read from ffmpeg at a time (one second)
+STREAM_BLOCK_FRAMES = 100
+# seconds between the keyframes of each segment.  They are forced at fixed times from the first frame of the segment
+# rather than left to the encoder's scene detection, so that every segment starts with one and can be decoded on its
+# own.
+KEYFRAME_INTERVAL = 2
+KEYFRAME_ARGS = ['-force_key_frames', 'expr:gte(t,n_forced*%g)' % KEYFRAME_INTERVAL, '-sc_threshold', '0']
+# what HLS players expect to find in a segment: H.264 video (main.VIDEO_CODEC_ARGS) and AAC audio
+AUDIO_CODEC_ARGS = ['-c:a', 'aac']
+
+
+class SlidingQuantile:
+    """Approximate quantiles of the last `window` values added, using a histogram with logarithmically sized bins, so
+    memory stays constant however many values go through it."""
+    def __init__(self, window, bins=1024, max_value=1 << 17):
+        self.window = window
+        self.bins = bins
+        self.scale = bins / math.log2(max_value + 1)
+        self.histogram = np.zeros(bins, np.int64)
+        # ring buffer of the bin each value in the window went into, so it can be taken out again when it falls out
+        # of the window.
+        self.recent = np.zeros(window, np.int64)
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, np.float64)[-self.window:]
+        new = np.minimum((np.log2(values + 1) * self.scale).astype(np.int64), self.bins - 1)
+        slots = np.arange(self.count, self.count + len(new)) % self.window
+        if self.count >= self.window:
+            self.histogram -= np.bincount(self.recent[slots], minlength=self.bins)
+        elif self.count + len(new) > self.window:
+            # only the values that wrapped around replace old ones
+            wrapped = slots[self.window - self.count:]
+            self.histogram -= np.bincount(self.recent[wrapped], minlength=self.bins)
+        self.histogram += np.bincount(new, minlength=self.bins)
+        self.recent[slots] = new
+        self.count += len(new)
+
+    def quantile(self, q):
+        """The value below which roughly q of the values in the window fall."""
+        total = self.histogram.sum()
+        if not total:
+            return 0
+        b = int(np.searchsorted(np.cumsum(self.histogram), q * total, side='right'))
+        # the top edge of the bin
+        return 2 ** ((b + 1) / self.scale) - 1
+
+
+class StreamingDetector:
+    """Turns a stream of levels into decided keep-intervals, with a lookahead of `padding` frames.
+
+    Whether frame i is kept depends on whether there is sound anywhere within `padding` frames of it, so once pos
+    frames have been fed in, everything before pos - padding (the frontier) is final.
+    """
+    def __init__(self, threshold, padding, window):
+        self.threshold = threshold
+        self.padding = padding
+        self.levels = SlidingQuantile(window)
+        self.pos = 0
+        # kept runs that can't grow any more, and the one that still might, as [start, end) frame numbers.
+        self.closed = []
+        self.open = None
+        self.taken = 0
+
+    @property
+    def frontier(self):
+        """Frames before this are decided."""
+        return max(0, self.pos - self.padding)
+
+    def feed(self, levels):
+        self.levels.add(levels)
+        threshold = self.levels.quantile(self.threshold)
+        sound = Intervals.from_levels(levels, threshold).bounds + self.pos
+        self.pos += len(levels)
+        for start, end in sound:
+            start = max(0, start - self.padding)
+            end += self.padding
+            if self.open is not None and start <= self.open[1]:
+                self.open[1] = max(self.open[1], end)
+            else:
+                if self.open is not None:
+                    self.closed.append(tuple(self.open))
+                self.open = [start, end]
+        # a run is closed once no sound in the frames still to come could reach back far enough to extend it.
+        if self.open is not None and self.open[1] < self.frontier:
+            self.closed.append(tuple(self.open))
+            self.open = None
+
+    def finish(self):
+        """Call at the end of the input, which decides everything that is left."""
+        if self.open is not None:
+            self.closed.append((self.open[0], min(self.open[1], self.pos)))
+            self.open = None
+        self.padding = 0
+
+    def take(self, upto):
+        """Return the kept parts of the frames from the end of the previous take() up to upto (which must not be
+        past frontier) as an Intervals relative to the start of that range."""
+        assert upto <= self.frontier
+        runs = self.closed + ([tuple(self.open)] if self.open is not None else [])
+        bounds = [(max(start, self.taken) - self.taken, min(end, upto) - self.taken)
+                  for start, end in runs if start < upto and end > self.taken]
+        self.closed = [(start, end) for start, end in self.closed if end > upto]
+        result = Intervals(bounds, upto - self.taken)
+        self.taken = upto
+        return result
+
+
+class HLSWriter:
+    """Cuts consecutive windows of the input into the segments of an HLS playlist in outdir."""
+    def __init__(self, input_file, outdir, segment_time, video=True):
+        self.input_file = input_file
+        self.outdir = outdir
+        self.video = video
+        self.target_duration = math.ceil(segment_time)
+        self.segments = []
+        self.output_time = 0
+        os.makedirs(outdir, exist_ok=True)
+
+    def write(self, start_time, keep: Intervals):
+        """Append the kept parts of the window of the input that starts at start_time (keep is relative to
+        start_time)."""
+        if not keep.total():
+            return
+        name = 'segment%05d.ts' % len(self.segments)
+        script = os.path.join(self.outdir, 'filter.txt')
+        # the same select/setpts trees as main.process_video_select, with aselect/asetpts doing the audio.  -ss makes
+        # the timestamps of the window start from 0 and -output_ts_offset carries them on from the previous segment.
+        filters = ["[0:a]aselect='{}',asetpts=N/SR/TB[a]".format(keep.select_expr(main.FRAME_LENGTH))]
+        if self.video:
+            filters.append("[0:v]select='{}',setpts='{}'[v]".format(keep.select_expr(main.FRAME_LENGTH),
+                                                                     keep.setpts_expr(main.FRAME_LENGTH)))
+        with open(script, 'w') as f:
+            f.write(';'.join(filters))
+        duration = keep.total() * main.FRAME_LENGTH
+        profiling.check_call(name,
+                             ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                              '-ss', '%.3f' % start_time, '-t', '%.3f' % (keep.length * main.FRAME_LENGTH),
+                              '-i', self.input_file,
+                              '-filter_complex_script', script,
+                              '-map', '[a]'] + (['-map', '[v]'] if self.video else []) +
+                             AUDIO_CODEC_ARGS +
+                             (main.VIDEO_CODEC_ARGS + KEYFRAME_ARGS if self.video else []) +
+                             ['-output_ts_offset', '%.3f' % self.output_time,
+                              '-f', 'mpegts', os.path.join(self.outdir, name)],
+                             stdin=subprocess.DEVNULL)
+        os.remove(script)
+        self.segments.append((name, duration))
+        self.output_time += duration
+        self._write_playlist()
+
+    def close(self):
+        self._write_playlist(ended=True)
+
+    def _write_playlist(self, ended=False):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-PLAYLIST-TYPE:EVENT',
+                 '#EXT-X-TARGETDURATION:%d' % self.target_duration, '#EXT-X-MEDIA-SEQUENCE:0']
+        for name, duration in self.segments:
+            lines += ['#EXTINF:%.3f,' % duration, name]
+        if ended:
+            lines.append('#EXT-X-ENDLIST')
+        # players may read the playlist at any moment, so replace it in one go rather than rewriting it in place.
+        path = os.path.join(self.outdir, 'index.m3u8')
+        with open(path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
+
+
+def jumpcut_stream(file, outdir, threshold=0.7, padding_time=0.02, window_time=600, segment_time=60, metric='pp',
+                   video=True, follow=False, follow_timeout=30):
+    """Jumpcut file into an HLS playlist (outdir/index.m3u8) as the file is read.
+
+    threshold is applied to the last window_time seconds of audio rather than the whole file.  With follow, the input
+    is treated as a recording that is still being written: reading waits for more data to arrive, and stops once none
+    has for follow_timeout seconds.
+    """
+    frame_size = int(main.FRAME_LENGTH * ANALYSIS_RATE)
+    padding = int(padding_time / main.FRAME_LENGTH)
+    segment_frames = int(segment_time / main.FRAME_LENGTH)
+    detector = StreamingDetector(threshold, padding, int(window_time / main.FRAME_LENGTH))
+    writer = HLSWriter(file, outdir, segment_time, video)
+    proc = profiling.Process('read audio',
+                             ['ffmpeg', '-hide_banner', '-loglevel', 'warning'] +
+                             (['-follow', '1', '-rw_timeout', str(int(follow_timeout * 1e6))] if follow else []) +
+                             ['-i', file, '-vn', '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1',
+                              '-ar', str(ANALYSIS_RATE), '-'],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = proc.stdout.read(frame_size * 2 * STREAM_BLOCK_FRAMES)
+            if len(data) < 2:
+                break
+            samples = np.frombuffer(data[:len(data) // 2 * 2], '<i2')
+            detector.feed(detectors.frame_levels(samples, frame_size, metric))
+            while detector.frontier - detector.taken >= segment_frames:
+                start = detector.taken
+                writer.write(start * main.FRAME_LENGTH, detector.take(start + segment_frames))
+                print('Wrote %.0f seconds of output from %.0f seconds of input.' % (
+                    writer.output_time, detector.taken * main.FRAME_LENGTH))
+        detector.finish()
+        if detector.pos > detector.taken:
+            start = detector.taken
+            writer.write(start * main.FRAME_LENGTH, detector.take(detector.pos))
+        writer.close()
+    finally:
+        proc.kill()
+        proc.wait()
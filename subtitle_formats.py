@@ -0,0 +1,244 @@
+"""
+Retiming of subtitle files to match a jumpcut, for Advanced SubStation (ASS/SSA), SubRip (SRT) and WebVTT.
+
+Each file is read once, a line at a time, and its events are retimed in batches of BATCH_EVENTS with
+NonLinearTime.convert_many, so memory stays bounded and conversion stays cheap however many events there are.  Events
+whose time on screen was cut out entirely are dropped; events that were partly cut out are clipped to what is left,
+which convert already does by mapping a time inside a removed portion to where the output picks up again.
+
+Subtitle tracks embedded in the input are pulled out by extract_tracks, with a single ffmpeg run for all of them.
+"""
+import json
+import os
+import re
+import subprocess
+import numpy as np
+import profiling
+
+# number of events converted at a time
+BATCH_EVENTS = 1 << 14
+# events shorter than this after retiming (but not before) are dropped.  It is the precision of ASS times.
+MIN_DURATION = 0.01
+# how the text subtitle codecs ffmpeg knows are extracted from a container: (codec to extract with, format)
+_EMBEDDED_CODECS = {
+    'ass': ('copy', 'ass'),
+    'ssa': ('ass', 'ass'),
+    'subrip': ('copy', 'srt'),
+    'srt': ('copy', 'srt'),
+    'webvtt': ('copy', 'vtt'),
+    'mov_text': ('srt', 'srt'),
+    'text': ('srt', 'srt'),
+}
+_EXTENSIONS = {'.ass': 'ass', '.ssa': 'ass', '.srt': 'srt', '.vtt': 'vtt'}
+# how each format writes times: (decimal places, format of hours, minutes, seconds and the fraction)
+_ASS_TIME = (2, '%d:%02d:%02d.%02d')
+_SRT_TIME = (3, '%02d:%02d:%02d,%03d')
+_VTT_TIME = (3, '%02d:%02d:%02d.%03d')
+# the timing line of an SRT or WebVTT cue, e.g. "00:01:02,345 --> 00:01:04,000" or "01:02.345 --> 01:04.000 line:0"
+_TIME = r'(?:\d+:)?\d+:\d+[.,]\d+'
+_TIMING_RE = re.compile(r'\s*(?P<start>%s)\s*-->\s*(?P<end>%s)(?P<settings>.*)' % (_TIME, _TIME))
+
+
+def detect_format(path):
+    """'ass', 'srt' or 'vtt', going by the extension of path or failing that its first line, or None if it's in some
+    other format."""
+    fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt:
+        return fmt
+    with open(path, encoding='utf-8-sig', errors='surrogateescape') as f:
+        first = f.readline().strip()
+    if first.startswith('WEBVTT'):
+        return 'vtt'
+    if first == '[Script Info]':
+        return 'ass'
+    if first.isdigit():
+        return 'srt'
+    return None
+
+
+def extract_tracks(file, tmpdir):
+    """Extract every text subtitle track embedded in file into tmpdir, and return [(path, format, language), ...] for
+    them.  Bitmap subtitles (DVD, Blu-ray) can't be retimed as text, so they are left out."""
+    try:
+        output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 's',
+                                 '-show_entries', 'stream=index,codec_name:stream_tags=language',
+                                 '-of', 'json', file],
+                                check=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    tracks = []
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', file]
+    for stream in json.loads(output).get('streams', []):
+        if stream.get('codec_name') not in _EMBEDDED_CODECS:
+            continue
+        codec, fmt = _EMBEDDED_CODECS[stream['codec_name']]
+        path = os.path.join(tmpdir, 'subtitles%d.%s' % (len(tracks), fmt))
+        cmd += ['-map', '0:%d' % stream['index'], '-c:s', codec, path]
+        tracks.append((path, fmt, stream.get('tags', {}).get('language')))
+    if tracks and profiling.call('extract subtitles', cmd, stdin=subprocess.DEVNULL):
+        return []
+    return tracks
+
+
+def retime_file(infile, outfile, converter, fmt):
+    """Retime the subtitle file infile (in format fmt) into outfile.  Returns (events kept, events dropped)."""
+    # decode and encode with surrogateescape, so that files that aren't really UTF-8 come out byte for byte the same
+    # apart from the times.
+    with open(infile, encoding='utf-8-sig', errors='surrogateescape', newline='') as fin, \
+            open(outfile, 'w', encoding='utf-8', errors='surrogateescape', newline='') as fout:
+        return RETIMERS[fmt](fin, fout, converter)
+
+
+def retime_ass(infile, outfile, converter):
+    """Retime the Dialogue and Comment events of an ASS or SSA file.  Everything else is copied as it is."""
+    return _retime_events(_ass_items(infile), outfile, converter, _ASS_TIME)
+
+
+def retime_srt(infile, outfile, converter):
+    """Retime an SRT file.  The cues that are kept are renumbered from 1."""
+    return _retime_events(_cue_items(infile, numbered=True), outfile, converter, _SRT_TIME)
+
+
+def retime_vtt(infile, outfile, converter):
+    """Retime the cues of a WebVTT file.  The header and NOTE, STYLE and REGION blocks are copied as they are."""
+    return _retime_events(_cue_items(infile, numbered=False), outfile, converter, _VTT_TIME)
+
+
+RETIMERS = {'ass': retime_ass, 'srt': retime_srt, 'vtt': retime_vtt}
+
+
+def _retime_events(items, outfile, converter, time_format):
+    """Write items to outfile.  Each item is either a string, which is written as it is, or an event (start, end,
+    render), where render(start, end, number) returns the text of the event as the number'th event written, with start
+    and end (its new times, formatted with time_format) in place of the old ones.  Returns (events kept, events
+    dropped)."""
+    kept = dropped = 0
+    pending = []
+    times = []
+
+    def flush():
+        nonlocal kept, dropped
+        times_in = np.array(times).reshape(-1, 2)
+        times_out = np.maximum(converter.convert_many(times_in), 0)
+        drop = ((times_out[:, 1] - times_out[:, 0] < MIN_DURATION) & (times_in[:, 1] - times_in[:, 0] >= MIN_DURATION))
+        text = iter(_format_times(times_out.ravel(), time_format))
+        drop = iter(drop.tolist())
+        for item in pending:
+            if isinstance(item, str):
+                outfile.write(item)
+                continue
+            start, end = next(text), next(text)
+            if next(drop):
+                dropped += 1
+                continue
+            kept += 1
+            outfile.write(item[2](start, end, kept))
+        pending.clear()
+        times.clear()
+
+    for item in items:
+        pending.append(item)
+        if not isinstance(item, str):
+            times.append(item[0])
+            times.append(item[1])
+            if len(times) >= 2 * BATCH_EVENTS:
+                flush()
+    flush()
+    return kept, dropped
+
+
+def _ass_items(infile):
+    # what comes before the actual subtitle events in an ASS file is some formatting information (what font to render
+    # the subtitles in, font size, color etc.)  Copy that information verbatim.
+    for line in infile:
+        yield line
+        if line.strip() == '[Events]':
+            break
+    start_idx = end_idx = None
+    for line in infile:
+        if not line.strip():
+            # the end of the events.  Anything after them (e.g. embedded fonts) is copied as it is.
+            yield line
+            break
+        kind, sep, rest = line.partition(':')
+        if sep and kind == 'Format':
+            # the ASS format is somewhat flexible, and uses Format: rows to define what CSV columns are used in the
+            # rest of the file.
+            fields = [x.strip() for x in rest.split(',')]
+            num_parts = len(fields) - 1
+            start_idx = fields.index('Start')
+            end_idx = fields.index('End')
+            yield line
+        elif sep and kind in ('Dialogue', 'Comment') and start_idx is not None:
+            # the text is the last field and may contain commas of its own
+            parts = rest.lstrip().rstrip('\r\n').split(',', num_parts)
+            # keep the line's own ending (CRLF or LF), like the lines that are copied as they are
+            newline = line[len(line.rstrip('\r\n')):]
+            yield (_parse_time(parts[start_idx]), _parse_time(parts[end_idx]),
+                   _ass_renderer(kind, parts, start_idx, end_idx, newline))
+        else:
+            # if we don't know what to do with a line, just put it through verbatim.
+            yield line
+    yield from infile
+
+
+def _ass_renderer(kind, parts, start_idx, end_idx, newline):
+    def render(start, end, number):
+        parts[start_idx] = start
+        parts[end_idx] = end
+        return '%s: %s%s' % (kind, ','.join(parts), newline)
+    return render
+
+
+def _cue_items(infile, numbered):
+    """The items of an SRT file (numbered) or WebVTT file, which are both made of blocks separated by blank lines."""
+    block = []
+    for line in infile:
+        if line.strip():
+            block.append(line.rstrip('\r\n'))
+        elif block:
+            yield _cue_item(block, numbered)
+            block = []
+    if block:
+        yield _cue_item(block, numbered)
+
+
+def _cue_item(block, numbered):
+    for i, line in enumerate(block):
+        match = _TIMING_RE.match(line)
+        if match:
+            break
+    else:
+        # not a cue: the WEBVTT header, or a NOTE, STYLE or REGION block
+        return '\n'.join(block) + '\n\n'
+    # an SRT cue starts with its number, which is replaced.  A WebVTT cue may start with an identifier, which is kept.
+    before = [] if numbered else block[:i]
+    settings = match.group('settings')
+    text = block[i + 1:]
+
+    def render(start, end, number):
+        lines = [str(number)] if numbered else list(before)
+        lines.append('%s --> %s%s' % (start, end, settings))
+        return '\n'.join(lines + text) + '\n\n'
+    return _parse_time(match.group('start')), _parse_time(match.group('end')), render
+
+
+def _parse_time(s):
+    """Parse a time like 1:02:03.45 (ASS), 01:02:03,456 (SRT) or 02:03.456 (WebVTT, where the hours are optional)
+    into seconds."""
+    fields = s.split(':')
+    if len(fields) == 3:
+        return int(fields[0]) * 3600 + int(fields[1]) * 60 + float(fields[2].replace(',', '.'))
+    return int(fields[0]) * 60 + float(fields[1].replace(',', '.'))
+
+
+def _format_times(seconds, time_format):
+    """Format an array of times with time_format.  The whole time is rounded once, before it is split into hours,
+    minutes and seconds, so that e.g. 59.999 seconds can't come out as 0:00:60.00."""
+    decimals, pattern = time_format
+    scale = 10 ** decimals
+    fraction = np.round(seconds * scale).astype(np.int64)
+    hours, fraction = np.divmod(fraction, 3600 * scale)
+    minutes, fraction = np.divmod(fraction, 60 * scale)
+    secs, fraction = np.divmod(fraction, scale)
+    return [pattern % t for t in zip(hours.tolist(), minutes.tolist(), secs.tolist(), fraction.tolist())]
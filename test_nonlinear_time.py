@@ -0,0 +1,65 @@
+"""Checks of the setpts expressions against NonLinearTime.convert, evaluated with nonlinear_time.eval_ffmpeg_expr rather
+than by running ffmpeg.  Run with `python -m pytest test_nonlinear_time.py`."""
+import numpy as np
+from nonlinear_time import NonLinearTime, _depth, eval_ffmpeg_expr
+
+TB = 1 / 90000
+# the expressions round times to 2 decimal places, which can put an output time out by 0.005 seconds plus 0.005 times
+# the speed of its segment.
+TOLERANCE = 0.02
+
+
+def make_timeline(seconds=600, seed=0):
+    """Segments of 0.05-3 seconds, removed or played at assorted speeds, like jumpcut with a silent speed other than 0
+    or 1 makes (and timestretch has to follow)."""
+    rng = np.random.default_rng(seed)
+    starts = np.concatenate(([0], np.cumsum(rng.uniform(0.05, 3, int(seconds / 0.05)))))
+    starts = starts[starts < seconds]
+    speeds = rng.choice([0, 0.25, 0.5, 1, 1.5, 2], len(starts))
+    return NonLinearTime(list(zip(starts.tolist(), speeds.tolist())))
+
+
+def _evaluate(expr, seconds):
+    return eval_ffmpeg_expr(expr, PTS=round(seconds / TB), TB=TB) * TB
+
+
+def test_tree_expr_matches_convert():
+    converter = make_timeline(60)
+    expr = converter.generate_setpts_tree_expr()
+    for t in np.random.default_rng(1).uniform(0, 70, 500):
+        assert abs(_evaluate(expr, t) - converter.convert(t)) < TOLERANCE, t
+
+
+def test_tree_expr_is_shallow():
+    converter = make_timeline(600)
+    assert _depth(converter.generate_setpts_tree_expr()) < 2 * np.log2(len(converter.cache)) + 4
+
+
+def test_chunked_tree_exprs_cover_the_timeline():
+    converter = make_timeline(600)
+    chunks = list(converter.generate_chunked_setpts_tree_exprs(max_length=4000, rebase=True))
+    assert len(chunks) > 1
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] is None
+    for (_, end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    assert all(len(expr) < 4000 and _depth(expr) < 100 for _, _, expr in chunks)
+
+
+def test_rebased_chunks_match_convert():
+    # process_video seeks to the start of each chunk, so PTS counts from there, and with rebase each chunk's output
+    # starts from 0 because the chunks are joined end to end.
+    converter = make_timeline(600)
+    rng = np.random.default_rng(2)
+    for start, end, expr in converter.generate_chunked_setpts_tree_exprs(max_length=4000, rebase=True):
+        for t in rng.uniform(start, 620 if end is None else end, 20):
+            expected = converter.convert(t) - converter.convert(start)
+            assert abs(_evaluate(expr, t - start) - expected) < TOLERANCE, (start, t)
+
+
+def test_unrebased_chunks_match_convert():
+    converter = make_timeline(600)
+    rng = np.random.default_rng(3)
+    for start, end, expr in converter.generate_chunked_setpts_tree_exprs(max_length=4000):
+        for t in rng.uniform(start, 620 if end is None else end, 20):
+            assert abs(_evaluate(expr, t - start) - converter.convert(t)) < TOLERANCE, (start, t)
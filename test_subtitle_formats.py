@@ -0,0 +1,122 @@
+"""Checks of subtitle_formats on small in-memory ASS, SRT and WebVTT files.  Run with
+`python -m pytest test_subtitle_formats.py`."""
+import io
+import subtitle_formats
+from nonlinear_time import NonLinearTime
+
+# 0-2 seconds are kept, 2-5 are cut out and 5 onwards is kept, so the output skips from 2 straight to 5.
+TIMELINE = NonLinearTime([(0, 1), (2, 0), (5, 1)])
+
+ASS = """[Script Info]
+Title: test
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize
+Style: Default,Arial,20
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:00.50,0:00:01.50,Default,,0,0,0,,kept, with a comma
+Dialogue: 0,0:00:02.50,0:00:04.50,Default,,0,0,0,,in the silence
+Comment: 0,0:00:01.00,0:00:03.00,Default,,0,0,0,,partly cut
+Dialogue: 0,0:00:06.00,0:00:07.00,Default,,0,0,0,,after
+
+[Fonts]
+"""
+
+SRT = """1
+00:00:00,500 --> 00:00:01,500
+kept
+
+2
+00:00:02,500 --> 00:00:04,500
+in the silence
+
+3
+00:00:04,000 --> 00:00:06,000
+partly cut
+over two lines
+
+4
+00:00:06,000 --> 00:00:07,000
+after
+"""
+
+VTT = """WEBVTT - a title
+
+NOTE a comment
+
+intro
+00:00.500 --> 00:01.500 line:0
+kept
+
+00:02.500 --> 00:04.500
+in the silence
+
+outro
+00:06.000 --> 00:07.000 align:start
+after
+"""
+
+
+def _retime(retimer, text):
+    outfile = io.StringIO(newline='')
+    counts = retimer(io.StringIO(text, newline=''), outfile, TIMELINE)
+    return outfile.getvalue(), counts
+
+
+def test_ass():
+    out, counts = _retime(subtitle_formats.retime_ass, ASS)
+    assert counts == (3, 1)
+    assert out == ASS.replace(
+        'Dialogue: 0,0:00:02.50,0:00:04.50,Default,,0,0,0,,in the silence\n', '').replace(
+        '0:00:01.00,0:00:03.00', '0:00:01.00,0:00:02.00').replace(
+        '0:00:06.00,0:00:07.00', '0:00:03.00,0:00:04.00')
+
+
+def test_ass_keeps_crlf():
+    out, _ = _retime(subtitle_formats.retime_ass, ASS.replace('\n', '\r\n'))
+    assert out.count('\r\n') == out.count('\n')
+    assert 'Dialogue: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,after\r\n' in out
+
+
+def test_srt_drops_clips_and_renumbers():
+    out, counts = _retime(subtitle_formats.retime_srt, SRT)
+    assert counts == (3, 1)
+    assert out == """1
+00:00:00,500 --> 00:00:01,500
+kept
+
+2
+00:00:02,000 --> 00:00:03,000
+partly cut
+over two lines
+
+3
+00:00:03,000 --> 00:00:04,000
+after
+
+"""
+
+
+def test_vtt_keeps_header_and_identifiers():
+    out, counts = _retime(subtitle_formats.retime_vtt, VTT)
+    assert counts == (2, 1)
+    assert out == """WEBVTT - a title
+
+NOTE a comment
+
+intro
+00:00:00.500 --> 00:00:01.500 line:0
+kept
+
+outro
+00:00:03.000 --> 00:00:04.000 align:start
+after
+
+"""
+
+
+def test_detect_format():
+    assert subtitle_formats.detect_format('a.SRT') == 'srt'
+    assert subtitle_formats.detect_format('a.ssa') == 'ass'
@@ -0,0 +1,61 @@
+"""A/V sync checks of timestretch.stretch_audio: the stretched audio has to be exactly as long as the timeline says, and
+every segment has to turn up where NonLinearTime.convert puts the video of it, at its original pitch.  Run with
+`python -m pytest test_timestretch.py`."""
+import wave
+import numpy as np
+import pytest
+import main
+import timestretch
+from nonlinear_time import NonLinearTime
+
+SECONDS = 45
+FRAMERATE = 48000
+
+
+@pytest.fixture(scope='module')
+def stretched(tmp_path_factory):
+    """A timeline of 0.2-3 second segments at assorted speeds over SECONDS of stereo audio in which each segment is a
+    tone of its own frequency, and the result of stretching it: (bounds, freqs, converter, frames written, the
+    stretched samples of the first channel)."""
+    rng = np.random.default_rng(0)
+    bounds = np.concatenate(([0], np.cumsum(rng.uniform(0.2, 3, int(SECONDS / 0.2)))))
+    bounds = bounds[bounds < SECONDS]
+    speeds = rng.choice([0, 0.25, 0.5, 1, 1.5, 2], len(bounds))
+    freqs = rng.uniform(200, 2000, len(bounds))
+    converter = NonLinearTime(list(zip(bounds.tolist(), speeds.tolist())))
+    tmpdir = tmp_path_factory.mktemp('timestretch')
+    path = str(tmpdir / 'audio.wav')
+    out = str(tmpdir / 'out.wav')
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(2)
+        wf.setsampwidth(2)
+        wf.setframerate(FRAMERATE)
+        for i, (start, end) in enumerate(zip(bounds, np.append(bounds[1:], SECONDS))):
+            t = np.arange(round(start * FRAMERATE), round(end * FRAMERATE)) / FRAMERATE
+            tone = (np.sin(2 * np.pi * freqs[i] * t) * 8000).astype('<i2')
+            wf.writeframesraw(np.repeat(tone[:, None], 2, axis=1).tobytes())
+    written = timestretch.stretch_audio(main.DecodedAudio(path), out, converter)
+    samples = main.DecodedAudio(out).samples[:, 0].astype(np.float64)
+    return bounds, freqs, converter, written, samples
+
+
+def test_length_matches_timeline(stretched):
+    _, _, converter, written, samples = stretched
+    assert written == round(converter.convert(SECONDS) * FRAMERATE)
+    assert len(samples) == written
+
+
+def test_segments_keep_pitch_and_position(stretched):
+    bounds, freqs, converter, _, samples = stretched
+    checked = 0
+    for i, (start, end) in enumerate(zip(bounds, np.append(bounds[1:], SECONDS))):
+        out_start, out_end = converter.convert(start), converter.convert(end)
+        if out_end - out_start < 0.2:
+            continue
+        # look at the middle of the segment, away from where the windows straddle two tones
+        middle = samples[round((out_start + 0.05) * FRAMERATE):round((out_end - 0.05) * FRAMERATE)]
+        spectrum = np.abs(np.fft.rfft(middle * np.hanning(len(middle))))
+        peak = np.argmax(spectrum) * FRAMERATE / len(middle)
+        assert abs(peak - freqs[i]) < 2 * FRAMERATE / len(middle) + 5, (i, peak, freqs[i])
+        checked += 1
+    assert checked > 10
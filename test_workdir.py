@@ -0,0 +1,80 @@
+"""Checks of the stage skipping in workdir.WorkDir with temporary files.  Run with `python -m pytest test_workdir.py`."""
+import os
+import workdir
+from workdir import WorkDir
+
+
+def _setup(tmp_path):
+    input_file = tmp_path / 'input.mp4'
+    input_file.write_bytes(b'input')
+    return str(input_file), str(tmp_path / 'work')
+
+
+def _write(work, name, data):
+    with open(work.file(name), 'wb') as f:
+        f.write(data)
+
+
+def test_finished_stage_is_done_after_reopening(tmp_path):
+    input_file, path = _setup(tmp_path)
+    work = WorkDir(path, input_file)
+    assert not work.done('audio', {'threshold': 0.5})
+    _write(work, 'audio.wav', b'audio')
+    work.finish('audio', {'threshold': 0.5}, ['audio.wav'], samples=5)
+    assert work.done('audio', {'threshold': 0.5})
+
+    work = WorkDir(path, input_file)
+    assert work.done('audio', {'threshold': 0.5})
+    assert work.data('audio') == {'samples': 5}
+
+
+def test_key_mismatch_is_not_done(tmp_path):
+    input_file, path = _setup(tmp_path)
+    work = WorkDir(path, input_file)
+    work.finish('timeline', {'threshold': 0.5, 'padding': (1, 2)})
+    # the key is compared after going through JSON, so a tuple still matches the list it is stored as
+    assert WorkDir(path, input_file).done('timeline', {'threshold': 0.5, 'padding': (1, 2)})
+    assert not WorkDir(path, input_file).done('timeline', {'threshold': 0.6, 'padding': (1, 2)})
+    assert not WorkDir(path, input_file).done('other', {'threshold': 0.5, 'padding': (1, 2)})
+
+
+def test_changed_or_missing_file_is_redone(tmp_path):
+    input_file, path = _setup(tmp_path)
+    work = WorkDir(path, input_file)
+    for name in ('clip01.mkv', 'clip02.mkv'):
+        _write(work, name, name.encode())
+        work.finish(name, None, [name])
+
+    _write(work, 'clip01.mkv', b'half a clip')
+    os.remove(work.file('clip02.mkv'))
+    work = WorkDir(path, input_file)
+    assert not work.done('clip01.mkv')
+    assert not work.done('clip02.mkv')
+
+    _write(work, 'clip01.mkv', b'clip01.mkv')
+    assert WorkDir(path, input_file).done('clip01.mkv')
+
+
+def test_changed_input_resets_the_manifest(tmp_path):
+    input_file, path = _setup(tmp_path)
+    work = WorkDir(path, input_file)
+    work.finish('decode')
+    with open(input_file, 'ab') as f:
+        f.write(b' and more')
+    assert not WorkDir(path, input_file).done('decode')
+
+
+def test_without_manifest_nothing_is_done(tmp_path):
+    input_file, path = _setup(tmp_path)
+    # the input isn't looked at without a manifest, so it doesn't have to be a file
+    work = WorkDir(path, 'https://example.com/input.mp4', manifest=False)
+    work.finish('decode')
+    assert not work.done('decode')
+    assert not os.path.exists(work.file(workdir.MANIFEST))
+
+
+def test_relative_path_is_made_absolute(tmp_path, monkeypatch):
+    input_file, _ = _setup(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    work = WorkDir('work', input_file)
+    assert work.file('video_filter.txt') == str(tmp_path / 'work' / 'video_filter.txt')
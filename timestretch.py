@@ -0,0 +1,124 @@
+"""
+Change the speed of audio without changing its pitch, following a NonLinearTime timeline, so that the audio stays in
+sync with the video that process_video retimes with the same timeline.
+
+We use WSOLA (waveform similarity overlap-add): the output is built from windows of the input that overlap by half,
+laid down every HOP samples.  To speed up or slow down, the windows are taken from the input further apart or closer
+together than HOP, and each one is nudged (by up to SEARCH samples) to wherever it lines up best with the end of the
+previous one, so that their waveforms join up without the phasey smearing of naive overlap-add.
+"""
+import numpy as np
+import main
+
+# at 48kHz, windows are about 21ms long and can move by about 5ms to find a good match.
+WINDOW = 1024
+HOP = WINDOW // 2
+SEARCH = 256
+# the best match is first looked for in a copy of the audio with only every DECIMATE'th sample, then refined
+DECIMATE = 4
+# periodic hann windows overlapping by half add up to exactly 1
+_WINDOW = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(WINDOW) / WINDOW))[:, None]
+# samples of output collected before each write
+_WRITE_BLOCK = 1 << 16
+
+
+def stretch_audio(audio: main.DecodedAudio, fout, converter):
+    """Write the audio retimed by converter to the wave file fout.  Returns the number of frames written.
+
+    Each segment of the timeline is stretched by its own speed, and its output is made to end exactly where
+    converter says it should, so rounding never accumulates into drift between the audio and the video.
+    """
+    rate = audio.framerate
+    samples = audio.samples
+    limits = np.iinfo(samples.dtype)
+    written = 0
+    with open(fout, 'wb', buffering=0) as f:
+        f.write(bytes(main._WAV_HEADER_SIZE))
+        for start_time, end_time, output_time, speed in converter.cache:
+            start = min(round(start_time * rate), len(samples))
+            end = len(samples) if end_time is None else min(round(end_time * rate), len(samples))
+            if end <= start or not speed:
+                continue
+            # end at the sample converter puts the end of the segment at.  Going by the rounded start instead would
+            # leave each segment up to half a sample times its speed out.
+            target = round(converter.convert(end / rate) * rate) - written
+            if target <= 0:
+                continue
+            for block in _stretch_segment(samples, start, end, target):
+                if block.dtype != samples.dtype:
+                    block = np.clip(np.round(block), limits.min, limits.max).astype(samples.dtype)
+                f.write(block.tobytes())
+            written += target
+        f.seek(0)
+        f.write(main._wav_header(audio.nchannels, audio.sampwidth, rate,
+                                 written * audio.nchannels * audio.sampwidth))
+    return written
+
+
+def _stretch_segment(samples, start, end, target):
+    """Yield blocks of samples[start:end] stretched to exactly target frames."""
+    length = end - start
+    if abs(target - length) <= 2:
+        # normal speed, give or take rounding.  Copy it, and make up any difference with the last sample.
+        for pos in range(start, start + min(length, target), _WRITE_BLOCK):
+            yield samples[pos:min(pos + _WRITE_BLOCK, start + target, end)]
+        if target > length:
+            yield np.repeat(samples[end - 1:end], target - length, axis=0)
+        return
+    if length < WINDOW or target < WINDOW:
+        # too short for WSOLA to get going.  Just resample it; a few ms of changed pitch won't be noticed.
+        x = np.linspace(start, end - 1, target)
+        yield np.stack([np.interp(x, np.arange(start, end), samples[start:end, c])
+                        for c in range(samples.shape[1])], axis=1)
+        return
+    ratio = length / target
+    # output frame k covers output samples [(k-1)*HOP, (k+1)*HOP) and nominally comes from the input starting at
+    # start + k*HOP*ratio - HOP, so that its centre lands where the timeline says.  Windows near the edges of the
+    # segment borrow audio from either side of it, so every output sample is covered by two windows.
+    last_start = len(samples) - WINDOW
+    frames = -(-target // HOP)
+    pending = np.zeros((HOP, samples.shape[1]))
+    out = []
+    out_len = 0
+    previous = None
+    for k in range(frames + 1):
+        nominal = min(max(int(start + k * HOP * ratio) - HOP, 0), last_start)
+        pos = nominal if previous is None else _best_match(samples, nominal, previous + HOP, last_start)
+        previous = pos
+        frame = samples[pos:pos + WINDOW] * _WINDOW
+        if k:
+            out.append(pending + frame[:HOP])
+            out_len += HOP
+        pending = frame[HOP:]
+        if out_len >= _WRITE_BLOCK:
+            block = np.concatenate(out)
+            yield block[:min(len(block), target)]
+            target -= len(block)
+            out = []
+            out_len = 0
+    if out and target > 0:
+        yield np.concatenate(out)[:target]
+
+
+def _best_match(samples, nominal, natural, last_start):
+    """Find the start within SEARCH of nominal whose window best continues the window starting at natural."""
+    lo = max(nominal - SEARCH, 0)
+    hi = min(nominal + SEARCH, last_start)
+    if hi <= lo:
+        return lo
+    natural = min(natural, last_start)
+    template = _mono(samples[natural:natural + WINDOW:DECIMATE])
+    region = _mono(samples[lo:hi + WINDOW:DECIMATE])
+    candidates = np.lib.stride_tricks.sliding_window_view(region, len(template))
+    coarse = lo + int(np.argmax(candidates @ template)) * DECIMATE
+    # refine at full resolution around the coarse match
+    lo = max(coarse - DECIMATE, 0)
+    hi = min(coarse + DECIMATE, last_start)
+    template = _mono(samples[natural:natural + WINDOW])
+    region = _mono(samples[lo:hi + WINDOW])
+    candidates = np.lib.stride_tricks.sliding_window_view(region, WINDOW)
+    return lo + int(np.argmax(candidates @ template))
+
+
+def _mono(samples):
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0].astype(np.float64)
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST = 'manifest.json'
+# bump this whenever what a stage leaves behind changes, so that old work directories aren't trusted.
+VERSION = 1
+
+
+class WorkDir:
+    """The directory a jumpcut keeps its intermediate files in, and a manifest (manifest.json) of the stages that are
+    finished, so that running the same jumpcut again after a failure skips them.
+
+    Each stage is recorded with a key (anything JSON can represent) describing everything its result depends on, the
+    size and SHA-256 of every file it made, and whatever data the caller wants to keep.  A stage only counts as done if
+    it is asked for with the same key and its files are still there and unchanged, so a half-written file or different
+    parameters just mean it is done again.  Stages that depend on another one put a digest of its result in their key.
+
+    The manifest is about one input: if the input's size or modification time change, everything is redone.
+
+    With manifest=False (for a temporary directory, which won't be there to resume from) nothing is recorded or
+    checksummed, and no stage is ever done.
+    """
+    def __init__(self, path, file, manifest=True):
+        # absolute, because ffmpeg is given paths in here while running in other directories.
+        self.path = os.path.abspath(path)
+        self.enabled = manifest
+        self.lock = threading.Lock()
+        # stages whose files have been checked since the manifest was loaded
+        self._verified = set()
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest = {'version': VERSION, 'input': None, 'stages': {}}
+        if not manifest:
+            # the input may not be a file that can be stat'ed (a URL, say), and without a manifest it doesn't matter.
+            return
+        self.manifest['input'] = identity(file)
+        try:
+            with open(self.file(MANIFEST)) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return
+        if previous.get('version') == VERSION and previous.get('input') == self.manifest['input']:
+            self.manifest = previous
+
+    def file(self, name):
+        """The path of name in the work directory.  An absolute name is left as it is."""
+        return os.path.join(self.path, name)
+
+    def done(self, stage, key=None):
+        """Whether stage was finished with the same key and its files haven't changed since."""
+        with self.lock:
+            entry = self.manifest['stages'].get(stage)
+        if entry is None or entry['key'] != _normalise(key):
+            return False
+        if stage not in self._verified:
+            if any(checksum(self.file(name)) != expected for name, expected in entry['files'].items()):
+                return False
+            self._verified.add(stage)
+        return True
+
+    def data(self, stage):
+        """The data stage was finished with."""
+        with self.lock:
+            return self.manifest['stages'][stage]['data']
+
+    def finish(self, stage, key=None, files=(), **data):
+        """Record stage as finished with key, having made files (names in the work directory, or absolute paths)."""
+        if not self.enabled:
+            return
+        entry = {'key': _normalise(key), 'files': {name: checksum(self.file(name)) for name in files},
+                 'data': _normalise(data)}
+        with self.lock:
+            self.manifest['stages'][stage] = entry
+            self._verified.add(stage)
+            # write to a temporary name first so that a crash never leaves half a manifest.
+            with open(self.file(MANIFEST + '.tmp'), 'w') as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(self.file(MANIFEST + '.tmp'), self.file(MANIFEST))
+
+
+def identity(file):
+    """What a stage that reads file (other than the input) puts in its key: its path, size and modification time."""
+    st = os.stat(file)
+    return [os.path.abspath(file), st.st_size, st.st_mtime_ns]
+
+
+def checksum(path):
+    """[size, SHA-256] of the file at path, or None if it doesn't exist."""
+    try:
+        size = os.path.getsize(path)
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    except FileNotFoundError:
+        return None
+    return [size, h.hexdigest()]
+
+
+def digest(*values):
+    """A short hash of values (bytes, or anything JSON can represent), for the key of a stage that depends on them."""
+    h = hashlib.sha256()
+    for value in values:
+        h.update(value if isinstance(value, bytes) else json.dumps(value).encode())
+    return h.hexdigest()[:32]
+
+
+def _normalise(value):
+    # what the value will look like once it has been through the manifest (e.g. tuples become lists), so that keys
+    # compare equal before and after.
+    return json.loads(json.dumps(value))